@@ -6,15 +6,23 @@ Returns HTML snippets for HTMX forms, JSON for other endpoints.
 Usage: uvicorn api:app --host 0.0.0.0 --port 8082
 """
 
+import asyncio
 import os
 import re
+from typing import Annotated
 from fastapi import FastAPI, Form, Request
 from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from database import init_db, add_to_waitlist, subscribe, confirm_subscriber, unsubscribe
+import async_db
+from async_db import (
+    init_db, add_to_waitlist, subscribe, confirm_subscriber, unsubscribe,
+    run_maintenance_periodically,
+)
+import outbox
+from database import MAINTENANCE_INTERVAL_HOURS, normalize_interests
 from i18n import t
-from mail import send_confirmation
+from mail import close_smtp_pool
 
 BASE_URL = os.environ.get("BASE_URL", "https://labs.siskin.amsterdam")
 
@@ -32,8 +40,23 @@ EMAIL_RE = re.compile(r"^[a-zA-Z0-9._%+\-]+@[a-zA-Z0-9.\-]+\.[a-zA-Z]{2,}$")
 
 
 @app.on_event("startup")
-def startup():
-    init_db()
+async def startup():
+    await init_db()
+    if MAINTENANCE_INTERVAL_HOURS > 0:
+        app.state.maintenance = asyncio.create_task(
+            run_maintenance_periodically(MAINTENANCE_INTERVAL_HOURS)
+        )
+    if outbox.OUTBOX_WORKER:
+        outbox.start_worker()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    if getattr(app.state, "maintenance", None):
+        app.state.maintenance.cancel()
+    outbox.stop_worker()
+    async_db.shutdown()
+    close_smtp_pool()
 
 
 def _detect_lang(request: Request) -> str:
@@ -82,7 +105,7 @@ async def waitlist_submit(
         product = "all"
 
     ip = request.headers.get("x-forwarded-for", request.client.host if request.client else "")
-    added = add_to_waitlist(email, name, product, lang, ip)
+    added = await add_to_waitlist(email, name, product, lang, ip)
 
     if added:
         message = t("waitlist_success", lang)
@@ -99,26 +122,24 @@ async def subscribe_submit(
     request: Request,
     email: str = Form(...),
     name: str = Form(""),
-    interests: str = Form("all"),
+    interests: Annotated[list[str], Form()] = ("all",),
 ):
     lang = _detect_lang(request)
 
     if not EMAIL_RE.match(email):
         return HTMLResponse(_result_html(False, t("subscribe_invalid_email", lang), "subscribe"))
 
-    if interests not in ("all", "perch", "cache", "dash", "announcements"):
-        interests = "all"
+    interests = normalize_interests(interests)
 
     ip = request.headers.get("x-forwarded-for", request.client.host if request.client else "")
-    confirm_token, unsubscribe_token, is_new = subscribe(
-        email, name, interests=interests, language=lang, ip_address=ip
+    confirm_token, unsubscribe_token, is_new = await subscribe(
+        email, name, interests=interests, language=lang, ip_address=ip, send_confirmation=True
     )
 
     if not confirm_token:
         message = t("subscribe_already_confirmed", lang)
         return HTMLResponse(_result_html(False, message, "subscribe"))
 
-    send_confirmation(email, confirm_token, lang)
     message = t("subscribe_check_email", lang)
     return HTMLResponse(_result_html(True, message, "subscribe"))
 
@@ -129,7 +150,7 @@ async def subscribe_submit(
 async def subscribe_confirm(request: Request, token: str):
     """Confirm a subscriber and redirect to the static thank-you page."""
     lang = _detect_lang(request)
-    confirmed = confirm_subscriber(token)
+    confirmed = await confirm_subscriber(token)
     if confirmed:
         return RedirectResponse(url=f"/{lang}/subscribe-confirmed.html", status_code=302)
     else:
@@ -140,7 +161,7 @@ async def subscribe_confirm(request: Request, token: str):
 async def unsubscribe_handler(request: Request, token: str):
     """Unsubscribe and redirect to the static unsubscribed page."""
     lang = _detect_lang(request)
-    removed = unsubscribe(token)
+    removed = await unsubscribe(token)
     if removed:
         return RedirectResponse(url=f"/{lang}/unsubscribed.html", status_code=302)
     else:
@@ -1,20 +1,30 @@
 """Siskin Labs website — FastAPI application."""
 
+import csv
+import io
+import asyncio
 import os
 import re
+from typing import Annotated
 from fastapi import FastAPI, Request, Form, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
 from i18n import t, detect_language, SUPPORTED_LANGUAGES
-from database import (
+from database import EXPORT_COLUMNS, MAINTENANCE_INTERVAL_HOURS, normalize_interests
+import async_db
+import compose
+import dispatch
+import outbox
+from async_db import (
     init_db, add_to_waitlist, subscribe, confirm_subscriber, unsubscribe,
     create_newsletter, update_newsletter, get_newsletter, list_newsletters,
-    schedule_newsletter, mark_newsletter_sent, get_confirmed_subscribers,
-    delete_newsletter,
+    schedule_newsletter, count_subscribers, count_waitlist,
+    delete_newsletter, iter_export_rows, count_deliveries, get_send_job, cancel_send_job, interrupt_send_jobs,
+    run_maintenance_periodically,
 )
-from mail import send_confirmation, send_newsletter
+from mail import close_smtp_pool
 
 ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
 
@@ -24,8 +34,26 @@ templates = Jinja2Templates(directory="templates")
 
 
 @app.on_event("startup")
-def startup():
-    init_db()
+async def startup():
+    await init_db()
+    interrupted = await interrupt_send_jobs()
+    if interrupted:
+        print(f"[mail] Marked {interrupted} unfinished newsletter send job(s) as interrupted")
+    if MAINTENANCE_INTERVAL_HOURS > 0:
+        app.state.maintenance = asyncio.create_task(
+            run_maintenance_periodically(MAINTENANCE_INTERVAL_HOURS)
+        )
+    if outbox.OUTBOX_WORKER:
+        outbox.start_worker()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    if getattr(app.state, "maintenance", None):
+        app.state.maintenance.cancel()
+    outbox.stop_worker()
+    async_db.shutdown()
+    close_smtp_pool()
 
 
 def ctx(request: Request, **kwargs) -> dict:
@@ -106,7 +134,7 @@ async def waitlist_submit(
         product = "all"
 
     ip = request.headers.get("x-forwarded-for", request.client.host if request.client else "")
-    added = add_to_waitlist(email, name, product, lang, ip)
+    added = await add_to_waitlist(email, name, product, lang, ip)
 
     if added:
         message = t("waitlist_success", lang)
@@ -132,7 +160,7 @@ async def subscribe_submit(
     request: Request,
     email: str = Form(...),
     name: str = Form(""),
-    interests: str = Form("all"),
+    interests: Annotated[list[str], Form()] = ("all",),
 ):
     lang = detect_language(request)
 
@@ -143,11 +171,13 @@ async def subscribe_submit(
              "success": False, "message": t("subscribe_invalid_email", lang)},
         )
 
-    if interests not in ("all", "perch", "cache", "dash", "announcements"):
-        interests = "all"
+    interests = normalize_interests(interests)
 
     ip = request.headers.get("x-forwarded-for", request.client.host if request.client else "")
-    confirm_token, unsubscribe_token, is_new = subscribe(email, name, interests=interests, language=lang, ip_address=ip)
+    # Queues the confirmation email in the same transaction
+    confirm_token, unsubscribe_token, is_new = await subscribe(
+        email, name, interests=interests, language=lang, ip_address=ip, send_confirmation=True
+    )
 
     if not confirm_token:
         # Already confirmed
@@ -158,8 +188,6 @@ async def subscribe_submit(
              "success": False, "message": message},
         )
 
-    # Send confirmation email
-    send_confirmation(email, confirm_token, lang)
     message = t("subscribe_check_email", lang)
 
     return templates.TemplateResponse(
@@ -171,7 +199,7 @@ async def subscribe_submit(
 
 @app.get("/subscribe/confirm/{token}", response_class=HTMLResponse)
 async def subscribe_confirm(request: Request, token: str):
-    confirmed = confirm_subscriber(token)
+    confirmed = await confirm_subscriber(token)
     return templates.TemplateResponse(
         "subscribe_confirmed.html",
         ctx(request, active="subscribe", confirmed=confirmed),
@@ -180,7 +208,7 @@ async def subscribe_confirm(request: Request, token: str):
 
 @app.get("/unsubscribe/{token}", response_class=HTMLResponse)
 async def unsubscribe_page(request: Request, token: str):
-    removed = unsubscribe(token)
+    removed = await unsubscribe(token)
     return templates.TemplateResponse(
         "unsubscribed.html",
         ctx(request, active="subscribe", removed=removed),
@@ -209,11 +237,13 @@ async def admin_login(request: Request, token: str = ""):
 @app.get("/admin/newsletters", response_class=HTMLResponse)
 async def admin_newsletters_list(request: Request):
     verify_admin(request)
-    newsletters = list_newsletters()
-    subscribers_count = len(get_confirmed_subscribers())
+    newsletters = await list_newsletters()
+    subscribers_count = await count_subscribers()
+    waitlist_count = await count_waitlist()
     return templates.TemplateResponse(
         "admin/newsletters.html",
-        ctx(request, active="admin", newsletters=newsletters, subscribers_count=subscribers_count),
+        ctx(request, active="admin", newsletters=newsletters, subscribers_count=subscribers_count,
+            waitlist_count=waitlist_count),
     )
 
 
@@ -234,29 +264,35 @@ async def admin_newsletter_create(
     body_en: str = Form(...),
     body_nl: str = Form(...),
     target: str = Form("all"),
+    body_format: str = Form("markdown"),
 ):
     verify_admin(request)
-    newsletter_id = create_newsletter(subject_en, subject_nl, body_en, body_nl, target)
+    if body_format not in compose.FORMATS:
+        raise HTTPException(status_code=400, detail="Unknown body format")
+    newsletter_id = await create_newsletter(subject_en, subject_nl, body_en, body_nl, target, body_format)
     return RedirectResponse(url=f"/admin/newsletters/{newsletter_id}", status_code=302)
 
 
 @app.get("/admin/newsletters/{newsletter_id}", response_class=HTMLResponse)
 async def admin_newsletter_view(request: Request, newsletter_id: int):
     verify_admin(request)
-    newsletter = get_newsletter(newsletter_id)
+    newsletter = await get_newsletter(newsletter_id)
     if not newsletter:
         raise HTTPException(status_code=404, detail="Not found")
-    target_count = len(get_confirmed_subscribers(newsletter["target"]))
+    target_count = await count_subscribers(newsletter["target"])
+    job = await get_send_job(newsletter_id)
+    delivered = await count_deliveries(newsletter_id)
     return templates.TemplateResponse(
         "admin/newsletter_detail.html",
-        ctx(request, active="admin", newsletter=newsletter, target_count=target_count),
+        ctx(request, active="admin", newsletter=newsletter, target_count=target_count, job=job,
+            delivered=delivered),
     )
 
 
 @app.get("/admin/newsletters/{newsletter_id}/edit", response_class=HTMLResponse)
 async def admin_newsletter_edit(request: Request, newsletter_id: int):
     verify_admin(request)
-    newsletter = get_newsletter(newsletter_id)
+    newsletter = await get_newsletter(newsletter_id)
     if not newsletter or newsletter["status"] != "draft":
         raise HTTPException(status_code=404, detail="Not found or not editable")
     return templates.TemplateResponse(
@@ -274,44 +310,65 @@ async def admin_newsletter_update(
     body_en: str = Form(...),
     body_nl: str = Form(...),
     target: str = Form("all"),
+    body_format: str = Form("markdown"),
 ):
     verify_admin(request)
-    update_newsletter(newsletter_id, subject_en, subject_nl, body_en, body_nl, target)
+    if body_format not in compose.FORMATS:
+        raise HTTPException(status_code=400, detail="Unknown body format")
+    await update_newsletter(newsletter_id, subject_en, subject_nl, body_en, body_nl, target, body_format)
     return RedirectResponse(url=f"/admin/newsletters/{newsletter_id}", status_code=302)
 
 
 @app.post("/admin/newsletters/{newsletter_id}/schedule", response_class=HTMLResponse)
 async def admin_newsletter_schedule(request: Request, newsletter_id: int):
     verify_admin(request)
-    schedule_newsletter(newsletter_id)
+    await schedule_newsletter(newsletter_id)
     return RedirectResponse(url=f"/admin/newsletters/{newsletter_id}", status_code=302)
 
 
 @app.post("/admin/newsletters/{newsletter_id}/send", response_class=HTMLResponse)
 async def admin_newsletter_send(request: Request, newsletter_id: int):
-    """Send a scheduled newsletter to all matching subscribers."""
+    """Start sending a scheduled newsletter to all matching subscribers in the background."""
     verify_admin(request)
-    newsletter = get_newsletter(newsletter_id)
+    newsletter = await get_newsletter(newsletter_id)
     if not newsletter or newsletter["status"] not in ("scheduled", "draft"):
         raise HTTPException(status_code=400, detail="Newsletter not sendable")
 
-    subscribers = get_confirmed_subscribers(newsletter["target"])
-    sent = 0
-    for sub in subscribers:
-        lang = sub.get("language", "en")
-        subject = newsletter["subject_nl"] if lang == "nl" else newsletter["subject_en"]
-        body = newsletter["body_nl"] if lang == "nl" else newsletter["body_en"]
-        if send_newsletter(sub["email"], subject, body, sub["unsubscribe_token"], lang):
-            sent += 1
+    job_id = await async_db.run(dispatch.start_send_job, newsletter)
+    if job_id is None:
+        raise HTTPException(status_code=400, detail="Newsletter not sendable")
+    return RedirectResponse(url=f"/admin/newsletters/{newsletter_id}", status_code=302)
 
-    mark_newsletter_sent(newsletter_id, sent)
+
+@app.get("/admin/newsletters/{newsletter_id}/progress", response_class=HTMLResponse)
+async def admin_newsletter_progress(request: Request, newsletter_id: int):
+    """Progress of the latest send job (HTMX partial, polled while the job runs)."""
+    verify_admin(request)
+    job = await get_send_job(newsletter_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Not found")
+    response = templates.TemplateResponse(
+        "partials/send_progress.html",
+        {"request": request, "newsletter_id": newsletter_id, "job": job},
+    )
+    if job["status"] != "running" and request.headers.get("hx-request"):
+        # Finished while the page was polling: reload it to show the new newsletter status.
+        response.headers["HX-Refresh"] = "true"
+    return response
+
+
+@app.post("/admin/newsletters/{newsletter_id}/cancel", response_class=HTMLResponse)
+async def admin_newsletter_cancel(request: Request, newsletter_id: int):
+    """Ask a running send job to stop after the messages in flight."""
+    verify_admin(request)
+    await cancel_send_job(newsletter_id)
     return RedirectResponse(url=f"/admin/newsletters/{newsletter_id}", status_code=302)
 
 
 @app.post("/admin/newsletters/{newsletter_id}/delete", response_class=HTMLResponse)
 async def admin_newsletter_delete(request: Request, newsletter_id: int):
     verify_admin(request)
-    delete_newsletter(newsletter_id)
+    await delete_newsletter(newsletter_id)
     return RedirectResponse(url="/admin/newsletters", status_code=302)
 
 
@@ -319,18 +376,46 @@ async def admin_newsletter_delete(request: Request, newsletter_id: int):
 async def admin_newsletter_preview(request: Request, newsletter_id: int):
     """Preview a newsletter as it would appear in email."""
     verify_admin(request)
-    newsletter = get_newsletter(newsletter_id)
+    newsletter = await get_newsletter(newsletter_id)
     if not newsletter:
         raise HTTPException(status_code=404, detail="Not found")
     lang = detect_language(request)
     subject = newsletter["subject_nl"] if lang == "nl" else newsletter["subject_en"]
-    body = newsletter["body_nl"] if lang == "nl" else newsletter["body_en"]
+    body = newsletter["html_nl"] if lang == "nl" else newsletter["html_en"]
     return templates.TemplateResponse(
         "admin/newsletter_preview.html",
         ctx(request, active="admin", newsletter=newsletter, subject=subject, body=body),
     )
 
 
+# --- Admin: Export ---
+
+@app.get("/admin/export/{table}.csv")
+async def admin_export(request: Request, table: str):
+    """Stream a table as CSV, one keyset page at a time."""
+    verify_admin(request)
+    if table not in EXPORT_COLUMNS:
+        raise HTTPException(status_code=404, detail="Not found")
+
+    async def rows():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS[table])
+        async for row in iter_export_rows(table):
+            writer.writerow(row)
+            if buffer.tell() > 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    return StreamingResponse(
+        rows(),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{table}.csv"'},
+    )
+
+
 # --- Health check ---
 
 @app.get("/health")
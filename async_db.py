@@ -0,0 +1,152 @@
+"""Awaitable data access for the async route handlers.
+
+The database functions the route handlers use have awaitable
+counterparts here with the same name and signature; anything else
+blocking goes through run(). Calls run on a dedicated thread pool sized
+to the connection pool, so SQLite disk I/O and lock waits happen off the
+event loop and never stall other requests in the worker.
+"""
+
+import asyncio
+import functools
+import threading
+from collections.abc import AsyncIterator, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+import outbox
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    # Created on first use, and again after shutdown() (app restarts in the same process).
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=database.POOL_SIZE, thread_name_prefix="db")
+        return _executor
+
+
+async def run(fn, *args, **kwargs):
+    """Run a blocking function that uses the database on the database executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(fn, *args, **kwargs))
+
+
+def _awaitable(fn):
+    """Wrap a blocking database function so it runs on the database executor."""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await run(fn, *args, **kwargs)
+    return wrapper
+
+
+async def run_maintenance_periodically(interval_hours: float) -> None:
+    """Run database.run_maintenance every interval_hours until cancelled."""
+    while True:
+        await asyncio.sleep(interval_hours * 3600)
+        try:
+            report = await run_maintenance()
+        except Exception as e:
+            print(f"[db] Maintenance failed: {e}")
+            continue
+        print(
+            f"[db] Maintenance: expired {report.expired} unconfirmed, "
+            f"pruned {report.outbox_pruned} outbox messages, "
+            f"freed {report.pages_freed} pages ({report.bytes_freed} bytes), "
+            f"checkpointed {report.wal_frames_checkpointed} WAL frames"
+        )
+
+
+def shutdown() -> None:
+    """Wait for in-flight queries and queued writes, then close pooled connections."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+    database.stop_group_writer()
+    database.close_pool()
+
+
+init_db = _awaitable(database.init_db)
+
+count_subscribers = _awaitable(database.count_subscribers)
+count_waitlist = _awaitable(database.count_waitlist)
+reconcile_counters = _awaitable(database.reconcile_counters)
+
+run_maintenance = _awaitable(database.run_maintenance)
+
+_add_to_waitlist = _awaitable(database.add_to_waitlist)
+_subscribe = _awaitable(database.subscribe)
+
+
+async def add_to_waitlist(email: str, name: str = "", product: str = "both",
+                          language: str = "en", ip_address: str = "") -> bool:
+    """Add an email to the waitlist. Returns True if added, False if exists."""
+    if database.WRITE_BATCHING:
+        # Await the group commit directly rather than parking a db thread on it.
+        return await asyncio.wrap_future(
+            database.queue_waitlist_write(email, name, product, language, ip_address)
+        )
+    return await _add_to_waitlist(email, name, product, language, ip_address)
+
+
+async def subscribe(email: str, name: str = "", language: str = "en",
+                    interests: str | Iterable[str] = "all", ip_address: str = "",
+                    send_confirmation: bool = False) -> tuple[str, str, bool]:
+    """Subscribe to the mailing list. See database.subscribe.
+
+    With send_confirmation the outbox worker is woken once the write commits.
+    """
+    if database.WRITE_BATCHING:
+        result = await asyncio.wrap_future(
+            database.queue_subscribe_write(email, name, language, interests, ip_address, send_confirmation)
+        )
+    else:
+        result = await _subscribe(email, name, language, interests, ip_address, send_confirmation)
+    if send_confirmation:
+        outbox.wake_worker()
+    return result
+
+confirm_subscriber = _awaitable(database.confirm_subscriber)
+unsubscribe = _awaitable(database.unsubscribe)
+
+create_newsletter = _awaitable(database.create_newsletter)
+update_newsletter = _awaitable(database.update_newsletter)
+get_newsletter = _awaitable(database.get_newsletter)
+list_newsletters = _awaitable(database.list_newsletters)
+schedule_newsletter = _awaitable(database.schedule_newsletter)
+mark_newsletter_sent = _awaitable(database.mark_newsletter_sent)
+count_deliveries = _awaitable(database.count_deliveries)
+get_send_job = _awaitable(database.get_send_job)
+cancel_send_job = _awaitable(database.cancel_send_job)
+interrupt_send_jobs = _awaitable(database.interrupt_send_jobs)
+get_recipient_page = _awaitable(database.get_recipient_page)
+delete_newsletter = _awaitable(database.delete_newsletter)
+
+outbox_stats = _awaitable(database.outbox_stats)
+
+import_subscribers = _awaitable(database.import_subscribers)
+get_export_page = _awaitable(database.get_export_page)
+
+
+async def _iter_pages(pages: Iterator[list]) -> AsyncIterator:
+    """Flatten a database.py page generator, fetching each page on the database executor."""
+    while (page := await run(next, pages, None)) is not None:
+        for item in page:
+            yield item
+
+
+def iter_confirmed_recipients(
+    target: str = "all", page_size: int = database.RECIPIENT_PAGE_SIZE, exclude_delivered: int | None = None,
+) -> AsyncIterator[database.Recipient]:
+    """Async counterpart of database.iter_confirmed_recipients."""
+    return _iter_pages(database.iter_recipient_pages(target, page_size, exclude_delivered))
+
+
+def iter_export_rows(table: str, page_size: int = database.EXPORT_PAGE_SIZE) -> AsyncIterator[tuple]:
+    """Async counterpart of database.iter_export_rows."""
+    return _iter_pages(database.iter_export_pages(table, page_size))
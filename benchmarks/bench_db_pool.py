@@ -0,0 +1,71 @@
+"""Signup throughput: pooled connections vs. connect-per-call.
+
+Runs add_to_waitlist() against a scratch database twice — once with the
+connection pool, once with the old behaviour of opening, configuring and
+closing a connection on every call — single-threaded and from a thread
+pool the size of uvicorn's default.
+
+Usage: python benchmarks/bench_db_pool.py [--signups 2000] [--threads 8]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import database
+
+
+@contextmanager
+def connect_per_call():
+    """Temporarily restore the pre-pool get_db() behaviour."""
+    checkout, checkin = database._checkout, database._checkin
+    database._checkout = database._connect
+    database._checkin = lambda conn: conn.close()
+    try:
+        yield
+    finally:
+        database._checkout, database._checkin = checkout, checkin
+
+
+def run(signups: int, threads: int, prefix: str) -> float:
+    emails = [f"{prefix}-{i}@example.com" for i in range(signups)]
+    start = time.perf_counter()
+    if threads <= 1:
+        for email in emails:
+            database.add_to_waitlist(email, "Bench", "all", "en", "127.0.0.1")
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(lambda e: database.add_to_waitlist(e, "Bench", "all", "en", "127.0.0.1"), emails))
+    return signups / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--signups", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, "bench.db")
+        database.init_db()
+
+        print(f"{args.signups} signups per run\n")
+        print(f"{'mode':<18}{'threads':>8}{'signups/s':>12}")
+        for threads in (1, args.threads):
+            with connect_per_call():
+                baseline = run(args.signups, threads, f"connect-{threads}")
+            pooled = run(args.signups, threads, f"pooled-{threads}")
+            print(f"{'connect-per-call':<18}{threads:>8}{baseline:>12.0f}")
+            print(f"{'pooled':<18}{threads:>8}{pooled:>12.0f}  ({pooled / baseline:.2f}x)")
+        database.close_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Compare WEBSITE_DB_PROFILE settings on the signup write path.
+
+For each profile, creates a fresh scratch database and runs a mix of
+add_to_waitlist()/subscribe() calls single-threaded and from a thread
+pool, reporting signups per second and failed calls.
+
+Usage: python benchmarks/bench_db_profiles.py [--signups 3000] [--threads 16] [--profiles safe,balanced]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import database
+
+
+def signup(i: int) -> bool:
+    email = f"bench-{i}@example.com"
+    try:
+        if i % 2:
+            database.add_to_waitlist(email, "Bench", "all", "en", "127.0.0.1")
+        else:
+            database.subscribe(email, "Bench", "en", "perch,dash", "127.0.0.1")
+        return True
+    except database.sqlite3.Error:
+        return False
+
+
+def run(signups: int, threads: int, offset: int) -> tuple[float, int]:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        ok = sum(pool.map(signup, range(offset, offset + signups)))
+    return signups / (time.perf_counter() - start), signups - ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--signups", type=int, default=3000)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--profiles", default=",".join(database.PROFILES))
+    args = parser.parse_args()
+
+    print(f"{args.signups} signups per run\n")
+    print(f"{'profile':<12}{'threads':>8}{'signups/s':>12}{'failed':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for profile in args.profiles.split(","):
+            database.close_pool()
+            database.DB_PROFILE = profile
+            database.DB_PATH = os.path.join(tmp, f"{profile}.db")
+            database.init_db()
+            for n, threads in enumerate((1, args.threads)):
+                rate, failed = run(args.signups, threads, n * args.signups)
+                print(f"{profile:<12}{threads:>8}{rate:>12.0f}{failed:>8}")
+        database.close_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Per-recipient newsletter cost: build a MIME tree per message vs. render-once.
+
+The baseline is the previous per-recipient path: format the wrapper with
+_wrap_newsletter, build a MIMEMultipart/MIMEText tree and flatten it the
+way smtplib.send_message() does. The compiled path renders the newsletter
+once (mail.NewsletterMessage) and splices in the address and unsubscribe
+URL per recipient. No SMTP involved, this is CPU and allocation only.
+
+Usage: python benchmarks/bench_newsletter_render.py [--recipients 50000] [--sample 2000]
+"""
+
+import argparse
+import io
+import secrets
+import sys
+import time
+import tracemalloc
+from email.generator import BytesGenerator
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import mail
+
+SUBJECT = "Siskin Labs: nieuws uit de werkplaats"
+BODY = (
+    "<h2>Wat er nieuw is</h2>"
+    + "<p>Perch, Cache en Dash kregen deze maand een flinke update. " * 30 + "</p>"
+    + "<ul>" + "<li>Verbeterde synchronisatie &amp; minder geheugen</li>" * 20 + "</ul>"
+)
+
+
+def per_message(email: str, token: str) -> bytes:
+    """The old path: render and build the MIME tree for every recipient."""
+    html = mail._wrap_newsletter(BODY, f"{mail.BASE_URL}/unsubscribe/{token}", "nl")
+    msg = MIMEMultipart("alternative")
+    msg["From"] = f"{mail.FROM_NAME} <{mail.FROM_EMAIL}>"
+    msg["To"] = email
+    msg["Subject"] = SUBJECT
+    msg.attach(MIMEText(html, "html"))
+    out = io.BytesIO()
+    BytesGenerator(out, policy=msg.policy.clone(linesep="\r\n")).flatten(msg)
+    return out.getvalue()
+
+
+def compiled():
+    message = mail.NewsletterMessage(SUBJECT, BODY, "nl")
+    return lambda email, token: message.render(email, token)
+
+
+def cpu_per_message(build, recipients: list[tuple[str, str]]) -> float:
+    start = time.process_time()
+    for email, token in recipients:
+        build(email, token)
+    return (time.process_time() - start) / len(recipients)
+
+
+def peak_per_message(build, recipients: list[tuple[str, str]]) -> float:
+    """Mean peak of memory allocated while building one message, via tracemalloc."""
+    tracemalloc.start()
+    total = 0
+    for email, token in recipients:
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        build(email, token)
+        total += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return total / len(recipients)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--recipients", type=int, default=50_000)
+    parser.add_argument("--sample", type=int, default=2000, help="messages traced for allocation stats")
+    args = parser.parse_args()
+
+    recipients = [(f"r{i}@example.com", secrets.token_urlsafe(32)) for i in range(args.recipients)]
+    sample = recipients[:args.sample]
+    paths = [("MIME tree per message", lambda: per_message), ("render once + splice", compiled)]
+
+    print(f"{args.recipients} recipients (allocations traced on {len(sample)})\n")
+    print(f"{'path':<24}{'us/msg':>9}{'total s':>9}{'peak KiB/msg':>14}")
+    baseline = None
+    for label, make in paths:
+        setup = time.process_time()
+        build = make()
+        setup = time.process_time() - setup
+        cpu = cpu_per_message(build, recipients)
+        peak = peak_per_message(build, sample)
+        baseline = baseline or (cpu, peak)
+        print(f"{label:<24}{cpu * 1e6:>9.1f}{cpu * len(recipients) + setup:>9.2f}{peak / 1024:>14.1f}"
+              f"  ({baseline[0] / cpu:.1f}x CPU, {baseline[1] / peak:.1f}x memory)")
+
+
+if __name__ == "__main__":
+    main()
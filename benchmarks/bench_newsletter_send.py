@@ -0,0 +1,154 @@
+"""End-to-end newsletter send against a local SMTP sink.
+
+Seeds a scratch SQLite database with confirmed subscribers, creates a
+newsletter and sends it the way the admin does: through
+dispatch.send_newsletter(), or with --via-admin through
+POST /admin/newsletters/{id}/send and the background job (needs the app's
+dependencies and httpx). Reports messages per second, p50/p99 latency of a
+single delivery (mail.deliver_newsletter, including waiting for an SMTP
+session) and the process's peak RSS, which includes the in-process sink.
+
+--min-rate / --max-p99-ms turn it into a regression check: the exit status
+is 1 when a threshold is missed.
+
+Usage: python benchmarks/bench_newsletter_send.py [--subscribers 10000] [--concurrency 4]
+           [--connect-ms 30] [--message-ms 2] [--via-admin] [--min-rate N] [--max-p99-ms N]
+"""
+
+import argparse
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from smtp_sink import SMTPSink
+
+REPO = Path(__file__).resolve().parent.parent
+
+BODY = """## Nieuws uit de werkplaats
+
+Perch, Cache en Dash kregen deze maand een flinke update. Lees de
+[release notes](https://siskin.amsterdam/perch) voor alle details.
+
+- Verbeterde synchronisatie
+- Minder geheugengebruik
+- Nieuwe sneltoetsen
+""" + "\nMeer over wat er komt, en waarom. " * 20
+
+
+def peak_rss_mib() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def seed(database, subscribers: int) -> int:
+    rows = (
+        {"email": f"bench-{i}@example.com", "language": "nl" if i % 3 == 0 else "en",
+         "interests": "perch,dash" if i % 2 else "all"}
+        for i in range(subscribers)
+    )
+    database.import_subscribers(rows, confirmed=True, chunk_size=5000)
+    return database.create_newsletter("Siskin Labs: update", "Siskin Labs: nieuws", BODY, BODY)
+
+
+def send_direct(newsletter_id: int) -> float:
+    import database
+    import dispatch
+
+    newsletter = database.get_newsletter(newsletter_id)
+    start = time.perf_counter()
+    dispatch.send_newsletter(newsletter, limiters=[])
+    return time.perf_counter() - start
+
+
+def send_via_admin(newsletter_id: int) -> float:
+    import database
+    from fastapi.testclient import TestClient
+
+    os.chdir(REPO)  # app.py mounts static/ and templates/ relative to the cwd
+    import app
+
+    with TestClient(app.app, cookies={"admin_token": os.environ["ADMIN_TOKEN"]}) as client:
+        start = time.perf_counter()
+        response = client.post(f"/admin/newsletters/{newsletter_id}/send", follow_redirects=False)
+        if response.status_code != 302:
+            raise RuntimeError(f"send failed: {response.status_code} {response.text}")
+        while database.get_send_job(newsletter_id)["status"] == "running":
+            time.sleep(0.05)
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--subscribers", type=int, default=10_000)
+    parser.add_argument("--concurrency", type=int, default=4, help="dispatch threads and SMTP sessions")
+    parser.add_argument("--connect-ms", type=float, default=30, help="sink connection setup delay")
+    parser.add_argument("--message-ms", type=float, default=2, help="sink per-message delay")
+    parser.add_argument("--via-admin", action="store_true", help="send through the admin route and job")
+    parser.add_argument("--min-rate", type=float, help="fail below this many msgs/s")
+    parser.add_argument("--max-p99-ms", type=float, help="fail above this p99 latency")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp, \
+            SMTPSink(connect_delay=args.connect_ms / 1000, message_delay=args.message_ms / 1000) as sink:
+        # The modules read these at import time.
+        os.environ.update(
+            WEBSITE_DB_PATH=os.path.join(tmp, "bench.db"), WEBSITE_DB_MAINTENANCE_HOURS="0",
+            SMTP_HOST=sink.host, SMTP_PORT=str(sink.port), SMTP_STARTTLS="0",
+            SMTP_USER="bench", SMTP_PASS="bench", SMTP_MAX_SESSIONS=str(args.concurrency),
+            NEWSLETTER_CONCURRENCY=str(args.concurrency), ADMIN_TOKEN="bench",
+        )
+        import database
+        import mail
+
+        database.init_db()
+        newsletter_id = seed(database, args.subscribers)
+        rss_seeded = peak_rss_mib()
+
+        latencies: list[float] = []
+        deliver = mail.deliver_newsletter
+
+        def timed_deliver(*a, **kw):
+            start = time.perf_counter()
+            try:
+                return deliver(*a, **kw)
+            finally:
+                latencies.append(time.perf_counter() - start)
+
+        mail.deliver_newsletter = timed_deliver
+
+        elapsed = (send_via_admin if args.via_admin else send_direct)(newsletter_id)
+
+        sent = database.count_deliveries(newsletter_id)
+        rate = sent / elapsed
+        p50, p99 = (q * 1000 for q in statistics.quantiles(latencies, n=100)[49::49])
+        mail.close_smtp_pool()
+        database.close_pool()
+
+        print(f"{args.subscribers} subscribers, {args.concurrency} threads/sessions, "
+              f"sink {args.connect_ms:g} ms connect + {args.message_ms:g} ms/message"
+              f"{', via admin route' if args.via_admin else ''}\n")
+        print(f"sent         {sent} ({len(latencies) - sent} failed) in {elapsed:.2f}s")
+        print(f"throughput   {rate:.0f} msgs/s")
+        print(f"latency      p50 {p50:.2f} ms, p99 {p99:.2f} ms")
+        print(f"connections  {sink.connections}")
+        print(f"peak RSS     {peak_rss_mib():.1f} MiB ({rss_seeded:.1f} MiB after seeding)")
+
+    failed = []
+    if args.min_rate is not None and rate < args.min_rate:
+        failed.append(f"throughput {rate:.0f} msgs/s < {args.min_rate:g}")
+    if args.max_p99_ms is not None and p99 > args.max_p99_ms:
+        failed.append(f"p99 {p99:.2f} ms > {args.max_p99_ms:g} ms")
+    if failed:
+        print("\nREGRESSION: " + "; ".join(failed))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
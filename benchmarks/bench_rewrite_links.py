@@ -0,0 +1,125 @@
+"""Static-site link rewriting: the old multi-pass rewriter vs. build.rewrite_links.
+
+The baseline is the previous implementation, kept here verbatim: two
+str.replace calls, a re.sub for the language switcher, one re.sub per page
+route and a root-href pass, about nine scans of every page. The current
+build.rewrite_links does one scan with a pattern compiled at import.
+
+Pages are the site's own rendered pages plus generated ones, large and
+link-heavy (nav, footer, product cards, static assets, external and
+anchor links). Every output is checked to be identical before timing.
+
+Usage: python benchmarks/bench_rewrite_links.py [--pages 2000] [--links 400] [--repeat 3]
+"""
+
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import build
+
+
+def legacy_rewrite_links(html: str, lang: str) -> str:
+    other_lang = "nl" if lang == "en" else "en"
+    html = html.replace('hx-post="/waitlist"', 'hx-post="/api/waitlist"')
+    html = html.replace('hx-post="/subscribe"', 'hx-post="/api/subscribe"')
+    html = re.sub(
+        r'href="/lang/' + re.escape(other_lang) + r'"',
+        f'href="/{other_lang}/"',
+        html,
+    )
+    page_routes = {
+        "/dash": f"/{lang}/dash.html",
+        "/perch": f"/{lang}/perch.html",
+        "/cache": f"/{lang}/cache.html",
+        "/waitlist": f"/{lang}/waitlist.html",
+        "/subscribe": f"/{lang}/subscribe.html",
+    }
+    for route, static_path in page_routes.items():
+        html = re.sub(
+            r'href="' + re.escape(route) + r'(#[^"]*)?"',
+            lambda m, sp=static_path: f'href="{sp}{m.group(1) or ""}"',
+            html,
+        )
+    html = re.sub(r'href="/"', f'href="/{lang}/"', html)
+    return html
+
+
+LINKS = [
+    '<a href="/">Home</a>', '<a href="/dash">Dash</a>', '<a href="/perch#pricing">Perch</a>',
+    '<a href="/cache">Cache</a>', '<a href="/waitlist">Waitlist</a>', '<a href="/subscribe#form">Nieuwsbrief</a>',
+    '<a href="/lang/nl">NL</a>', '<a href="/lang/en">EN</a>', '<a href="/dashboard">not a route</a>',
+    '<link rel="stylesheet" href="/static/css/style.css">', '<img src="/static/img/logo.svg" alt="">',
+    '<a href="https://github.com/siskinlabs">GitHub</a>', '<a href="#features">Features</a>',
+    '<a href="mailto:hello@siskin.amsterdam">Mail</a>',
+    '<form hx-post="/waitlist" hx-target="#result">', '<form hx-post="/subscribe" hx-swap="outerHTML">',
+]
+FILLER = "<p>Perch, Cache en Dash: kleine apps die precies doen wat ze beloven, zonder gedoe.</p>\n"
+
+
+def generated_pages(count: int, links: int, seed: int = 0) -> list[tuple[str, str]]:
+    rng = random.Random(seed)
+    pages = []
+    for i in range(count):
+        parts = []
+        for _ in range(links):
+            parts.append(rng.choice(LINKS))
+            parts.append(FILLER * rng.randint(0, 2))
+        pages.append(("<!DOCTYPE html>\n<html><body>\n" + "\n".join(parts) + "\n</body></html>\n",
+                      build.LANGUAGES[i % len(build.LANGUAGES)]))
+    return pages
+
+
+def site_pages() -> list[tuple[str, str]]:
+    env = build.make_env()
+    return [
+        (env.get_template(template_name).render(
+            lang=lang, t=lambda key, _lang=lang, **kw: build._t(key, _lang, **kw),
+            other_lang="nl" if lang == "en" else "en", other_lang_label="", active=active, **extra_ctx,
+        ), lang)
+        for lang in build.LANGUAGES
+        for template_name, _, active, extra_ctx in build.PAGES
+    ]
+
+
+def best_of(rewrite, pages: list[tuple[str, str]], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for html, lang in pages:
+            rewrite(html, lang)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=2000, help="generated pages")
+    parser.add_argument("--links", type=int, default=400, help="links per generated page")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs, best is reported")
+    args = parser.parse_args()
+
+    pages = site_pages() + generated_pages(args.pages, args.links)
+    mismatched = sum(legacy_rewrite_links(html, lang) != build.rewrite_links(html, lang) for html, lang in pages)
+    if mismatched:
+        print(f"MISMATCH: {mismatched} of {len(pages)} pages rewrite differently")
+        sys.exit(1)
+
+    size = sum(len(html) for html, _ in pages) / (1024 * 1024)
+    print(f"{len(pages)} pages, {size:.1f} MiB of HTML, output identical\n")
+    print(f"{'rewriter':<24}{'total s':>9}{'us/page':>10}{'MiB/s':>9}")
+    baseline = None
+    for label, rewrite in [("multi-pass (old)", legacy_rewrite_links), ("single pass", build.rewrite_links)]:
+        elapsed = best_of(rewrite, pages, args.repeat)
+        baseline = baseline or elapsed
+        print(f"{label:<24}{elapsed:>9.3f}{elapsed / len(pages) * 1e6:>10.1f}{size / elapsed:>9.1f}"
+              f"  ({baseline / elapsed:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Signup load test: one commit per signup vs. group commit.
+
+Fires concurrent add_to_waitlist()/subscribe() calls at a scratch
+database, first with WRITE_BATCHING off and then on, and reports
+signups per second and how many calls failed (e.g. "database is locked").
+
+Usage: python benchmarks/bench_signup_batching.py [--signups 4000] [--threads 32]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import database
+
+
+def signup(i: int, prefix: str) -> bool:
+    email = f"{prefix}-{i}@example.com"
+    try:
+        if i % 2:
+            database.add_to_waitlist(email, "Bench", "all", "en", "127.0.0.1")
+        else:
+            database.subscribe(email, "Bench", "en", "all", "127.0.0.1")
+        return True
+    except database.sqlite3.Error:
+        return False
+
+
+def run(signups: int, threads: int, batching: bool) -> tuple[float, int]:
+    database.WRITE_BATCHING = batching
+    prefix = "batched" if batching else "direct"
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        ok = sum(pool.map(lambda i: signup(i, prefix), range(signups)))
+    elapsed = time.perf_counter() - start
+    database.stop_group_writer()
+    return signups / elapsed, signups - ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--signups", type=int, default=4000)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--window-ms", type=float, default=database.WRITE_BATCH_WINDOW_MS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, "bench.db")
+        database.WRITE_BATCH_WINDOW_MS = args.window_ms
+        database.init_db()
+
+        print(f"{args.signups} signups from {args.threads} threads, window {args.window_ms} ms\n")
+        print(f"{'mode':<16}{'signups/s':>12}{'failed':>8}")
+        direct, direct_failed = run(args.signups, args.threads, batching=False)
+        print(f"{'commit-per-call':<16}{direct:>12.0f}{direct_failed:>8}")
+        batched, batched_failed = run(args.signups, args.threads, batching=True)
+        print(f"{'group commit':<16}{batched:>12.0f}{batched_failed:>8}  ({batched / direct:.2f}x)")
+        database.close_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""SMTP delivery: one connection per message vs. the pooled transport.
+
+Sends the same newsletter to N addresses through mail.send_newsletter()
+against a local SMTP sink that charges connect_delay per connection
+(standing in for TCP+TLS+AUTH). The baseline is a pool that recycles
+its session after every message, i.e. the old connect-per-message
+behaviour.
+
+Usage: python benchmarks/bench_smtp_pool.py [--messages 500] [--connect-ms 30] [--threads 4]
+"""
+
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import mail
+from smtp_sink import SMTPSink
+
+
+def run(messages: int, threads: int, per_session: int, sessions: int) -> float:
+    mail.close_smtp_pool()
+    mail.SMTP_MESSAGES_PER_SESSION = per_session
+    mail.SMTP_MAX_SESSIONS = sessions
+    body = "<h2>Bench</h2><p>" + "Lorem ipsum dolor sit amet. " * 40 + "</p>"
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(
+            lambda i: mail.send_newsletter(f"r{i}@example.com", "Bench", body, f"tok{i}", "en"),
+            range(messages),
+        ))
+    elapsed = time.perf_counter() - start
+    mail.close_smtp_pool()
+    return messages / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--connect-ms", type=float, default=30)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    with SMTPSink(connect_delay=args.connect_ms / 1000) as sink:
+        mail.SMTP_HOST, mail.SMTP_PORT = sink.host, sink.port
+        mail.SMTP_USER, mail.SMTP_PASS, mail.SMTP_STARTTLS = "bench", "bench", False
+
+        print(f"{args.messages} messages, {args.connect_ms:.0f} ms connection setup\n")
+        print(f"{'transport':<22}{'msgs/s':>10}{'connections':>13}")
+        rows = [
+            ("connect-per-message", 1, args.threads),
+            ("pooled", 1000, args.threads),
+        ]
+        baseline = None
+        for label, per_session, sessions in rows:
+            before = sink.connections
+            rate = run(args.messages, args.threads, per_session, sessions)
+            baseline = baseline or rate
+            print(f"{label:<22}{rate:>10.0f}{sink.connections - before:>13}  ({rate / baseline:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""In-process SMTP sink for mail benchmarks.
+
+Speaks just enough SMTP for smtplib (EHLO/HELO, AUTH PLAIN/LOGIN, MAIL,
+RCPT, DATA, RSET, NOOP, QUIT) and throws messages away after counting
+them. connect_delay simulates the TCP+TLS+AUTH setup cost of a real
+provider; message_delay simulates per-message latency.
+
+Usage as a library:
+
+    with SMTPSink(connect_delay=0.05) as sink:
+        mail.SMTP_HOST, mail.SMTP_PORT = sink.host, sink.port
+        ...
+        sink.messages, sink.connections
+"""
+
+import socketserver
+import threading
+import time
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def reply(self, line: str):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        sink: SMTPSink = self.server.sink
+        with sink.lock:
+            sink.connections += 1
+        time.sleep(sink.connect_delay)
+        self.reply("220 sink ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("ascii", "replace").strip().upper()
+            if command.startswith("EHLO"):
+                self.wfile.write(b"250-sink\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n")
+            elif command.startswith("HELO"):
+                self.reply("250 sink")
+            elif command.startswith("AUTH LOGIN"):
+                self.reply("334 VXNlcm5hbWU6")
+                self.rfile.readline()
+                self.reply("334 UGFzc3dvcmQ6")
+                self.rfile.readline()
+                self.reply("235 Authenticated")
+            elif command.startswith("AUTH"):
+                self.reply("235 Authenticated")
+            elif command.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                size = 0
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data == b".\r\n":
+                        break
+                    size += len(data)
+                time.sleep(sink.message_delay)
+                with sink.lock:
+                    sink.messages += 1
+                    sink.bytes += size
+                self.reply("250 Queued")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Not implemented")
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink:
+    def __init__(self, connect_delay: float = 0.0, message_delay: float = 0.0):
+        self.connect_delay = connect_delay
+        self.message_delay = message_delay
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+        self.bytes = 0
+        self._server = _Server(("127.0.0.1", 0), _Handler)
+        self._server.sink = self
+        self.host, self.port = self._server.server_address
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
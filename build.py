@@ -3,20 +3,73 @@
 Renders all Jinja2 templates to static HTML for both nl and en languages.
 Output goes to dist/ directory.
 
-Usage: python build.py
+Builds are incremental: .build-manifest.json records, for every output,
+content hashes of what it was built from (the template and the templates
+it extends or includes, the translation strings it uses, the static
+file, the builder itself). Pages also record the fingerprinted URL of
+each static asset they link to, so changing one asset only re-renders
+the pages that use it. Only outputs whose inputs changed are
+re-rendered or copied, and outputs whose source is gone are removed.
+Without a manifest (fresh checkout) or with --clean, dist/ is rebuilt
+from scratch.
+
+Static files are written under content-hashed names (style.css ->
+static/style.3f2a9c1b0e.css) and every /static/ URL in the pages and
+stylesheets points at them, so they can be cached forever (see
+Caddyfile.snippet). dist/asset-manifest.json maps the original URLs to
+the fingerprinted ones.
+
+Every HTML, CSS, SVG and other text output also gets .gz and (with the
+optional brotli package) .br siblings at maximum compression, for Caddy's
+`precompressed`. They are reused while their source is unchanged.
+
+Usage: python build.py [--clean] [-j WORKERS]
 """
 
+import argparse
+import functools
+import gzip
+import hashlib
+import inspect
+import json
+import re
+import os
+import posixpath
 import shutil
-from pathlib import Path
-from jinja2 import Environment, FileSystemLoader
-
+import traceback
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from graphlib import CycleError, TopologicalSorter
+from pathlib import Path, PurePosixPath
+from jinja2 import Environment, FileSystemLoader, meta
+
+import i18n
 from i18n import t as _t
 
+try:
+    import brotli
+except ImportError:  # optional: without it only .gz files are written
+    brotli = None
+
 # Configuration
 REPO_DIR = Path(__file__).parent
 TEMPLATES_DIR = REPO_DIR / "templates"
 STATIC_DIR = REPO_DIR / "static"
 DIST_DIR = REPO_DIR / "dist"
+MANIFEST_PATH = REPO_DIR / ".build-manifest.json"
+MANIFEST_VERSION = 1
+# Map of /static/ URLs to their fingerprinted names, written to dist/
+ASSET_MANIFEST = "asset-manifest.json"
+FINGERPRINT_LENGTH = 10
+
+# Outputs that get precompressed siblings (served by Caddy's `precompressed`)
+COMPRESSIBLE_SUFFIXES = {".html", ".css", ".js", ".json", ".svg", ".txt", ".xml"}
+COMPRESSORS = {
+    ".br": (lambda data: brotli.compress(data, quality=11)) if brotli else None,
+    ".gz": lambda data: gzip.compress(data, compresslevel=9, mtime=0),
+}
+# A compressed file is only kept if it is at most this fraction of the original.
+COMPRESSION_MAX_RATIO = 0.9
 
 LANGUAGES = ["nl", "en"]
 
@@ -43,74 +96,478 @@ def url_for_page(page_name: str, lang: str) -> str:
     return f"/{lang}/{page_name}"
 
 
-def build():
-    """Build the static site."""
-    # Clean dist directory
-    if DIST_DIR.exists():
-        shutil.rmtree(DIST_DIR)
-    DIST_DIR.mkdir(parents=True)
+ROOT_INDEX_HTML = (
+    '<!DOCTYPE html>\n'
+    '<html>\n'
+    '<head>\n'
+    '  <meta charset="UTF-8">\n'
+    '  <meta http-equiv="refresh" content="0;url=/nl/">\n'
+    '  <script>document.location.href="/nl/";</script>\n'
+    '</head>\n'
+    '<body>\n'
+    '  <p>Redirecting to <a href="/nl/">Dutch version</a>...</p>\n'
+    '</body>\n'
+    '</html>\n'
+)
+
+
+# --- Dependency tracking ---
+
+_T_CALL_RE = re.compile(r"\bt\(\s*(?:(['\"])(\w+)\1)?")
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _hash_file(path: Path) -> str:
+    with path.open("rb") as f:
+        return hashlib.file_digest(f, lambda: hashlib.blake2b(digest_size=16)).hexdigest()
+
+
+def template_sources(env: Environment, name: str) -> dict[str, str]:
+    """Source of a template and of every template it extends, includes or imports."""
+    sources: dict[str, str] = {}
+    pending = [name]
+    while pending:
+        current = pending.pop()
+        if current in sources:
+            continue
+        sources[current] = env.loader.get_source(env, current)[0]
+        for ref in meta.find_referenced_templates(env.parse(sources[current])):
+            # A computed template name could be anything: depend on all templates.
+            pending.extend([ref] if ref is not None else env.list_templates())
+    return sources
+
+
+def translation_keys(sources: dict[str, str]) -> set[str] | None:
+    """Keys passed to t() in the sources, or None if a key is computed."""
+    keys = set()
+    for source in sources.values():
+        for match in _T_CALL_RE.finditer(source):
+            if match.group(2) is None:
+                return None
+            keys.add(match.group(2))
+    return keys
+
+
+def _builder_hash() -> str:
+    """Changes to the rendering code (this file, t()) invalidate every page."""
+    return _digest(Path(__file__).read_bytes() + inspect.getsource(_t).encode())
+
+
+def page_inputs(env: Environment, template_name: str, lang: str, context: dict, builder: str) -> dict[str, str]:
+    """Input hashes for one rendered page, apart from the assets it uses (see asset_inputs)."""
+    sources = template_sources(env, template_name)
+    keys = translation_keys(sources)
+    strings = {key: _t(key, lang) for key in sorted(keys if keys is not None else i18n.TRANSLATIONS)}
+    inputs = {f"template:{name}": _digest(source.encode()) for name, source in sorted(sources.items())}
+    inputs["translations"] = _digest(json.dumps(strings, sort_keys=True).encode())
+    inputs["context"] = _digest(json.dumps(context, sort_keys=True, default=str).encode())
+    inputs["builder"] = builder
+    return inputs
+
+
+def asset_inputs(urls: Iterable[str], assets: dict[str, str]) -> dict[str, str]:
+    """Inputs for the /static/ URLs a page links to: their current fingerprinted URLs ('' if gone)."""
+    return {f"asset:{url}": assets.get(url, "") for url in sorted(urls)}
+
+
+def recorded_assets(previous: dict[str, dict[str, str]] | None, rel: str) -> list[str]:
+    """The /static/ URLs an output linked to when it was last built."""
+    return [key.removeprefix("asset:") for key in (previous or {}).get(rel, {}) if key.startswith("asset:")]
+
+
+def load_manifest() -> dict[str, dict[str, str]] | None:
+    """Inputs per output path from the last build, or None if there is no usable manifest."""
+    try:
+        manifest = json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest["outputs"]
+
+
+def save_manifest(outputs: dict[str, dict[str, str]]) -> None:
+    MANIFEST_PATH.write_text(
+        json.dumps({"version": MANIFEST_VERSION, "outputs": outputs}, indent=1, sort_keys=True) + "\n",
+        encoding="utf-8",
+    )
+
+
+def _is_fresh(previous: dict | None, rel: str, inputs: dict[str, str]) -> bool:
+    return previous is not None and previous.get(rel) == inputs and (DIST_DIR / rel).exists()
+
+
+def _remove_stale(previous: dict[str, dict[str, str]], outputs: dict[str, dict[str, str]]) -> int:
+    """Delete outputs from the last build that this build didn't produce."""
+    removed = 0
+    for rel in sorted(set(previous) - set(outputs)):
+        path = DIST_DIR / rel
+        if path.exists():
+            path.unlink()
+            removed += 1
+            print(f"  removed {rel}")
+        # Drop directories left empty, up to dist/ itself.
+        parent = path.parent
+        while parent != DIST_DIR and parent.exists() and not any(parent.iterdir()):
+            parent.rmdir()
+            parent = parent.parent
+    return removed
+
+
+# --- Asset fingerprinting ---
+
+# A /static/ URL in HTML or CSS, not part of a longer (external) URL.
+_STATIC_URL_RE = re.compile(r"(?<![\w./-])/static/[^\"'\s()?#,]+")
+# url(...) and @import "..." in a stylesheet
+_CSS_URL_RE = re.compile(r"""url\(\s*(['"]?)([^'"()\s]+)\1\s*\)|@import\s+(['"])([^'"]+)\3""")
+
+
+def fingerprinted_name(name: str, digest: str) -> str:
+    """style.css -> style.3f2a9c1b0e.css"""
+    path = PurePosixPath(name)
+    return str(path.with_name(f"{path.stem}.{digest[:FINGERPRINT_LENGTH]}{path.suffix}"))
+
+
+def fingerprint_urls(text: str, assets: dict[str, str], used: set[str] | None = None) -> str:
+    """Point /static/ URLs at their fingerprinted names. Unknown paths are left alone.
+
+    Every /static/ URL found, known or not, is added to `used`, if given.
+    """
+    def replace(match: re.Match) -> str:
+        url = match.group(0)
+        if used is not None:
+            used.add(url)
+        return assets.get(url, url)
+
+    return _STATIC_URL_RE.sub(replace, text)
+
 
-    # Copy static files
-    shutil.copytree(STATIC_DIR, DIST_DIR / "static")
-    print("Copied static/ -> dist/static/")
+def _css_url(match: re.Match) -> tuple[str, str]:
+    """(quote, url) of a _CSS_URL_RE match."""
+    return (match.group(1), match.group(2)) if match.group(2) is not None else (match.group(3), match.group(4))
 
-    # Set up Jinja2 environment
-    env = Environment(
+
+def _resolve_css_url(url: str, name: str) -> str | None:
+    """The /static/ URL a reference in static/{name} points at, None if not a local file."""
+    if url.startswith(("#", "data:")) or ":" in url:
+        return None
+    path = re.split(r"[?#]", url, maxsplit=1)[0]
+    if not path.startswith("/"):
+        path = posixpath.join(posixpath.dirname(f"/static/{name}"), path)
+    return posixpath.normpath(path)
+
+
+def css_references(css: str, name: str) -> set[str]:
+    """/static/ URLs referenced by the stylesheet static/{name}, by url() or @import."""
+    return {url for match in _CSS_URL_RE.finditer(css) if (url := _resolve_css_url(_css_url(match)[1], name))}
+
+
+def fingerprint_css(css: str, name: str, assets: dict[str, str]) -> str:
+    """Fingerprint the absolute and relative url()s and @imports in the stylesheet static/{name}."""
+    def relative(match: re.Match) -> str:
+        quote, url = _css_url(match)
+        if url.startswith("/"):
+            return match.group(0)  # absolute: fingerprint_urls below
+        target = assets.get(_resolve_css_url(url, name) or "")
+        if target is None:
+            return match.group(0)
+        rest = url[len(re.split(r"[?#]", url, maxsplit=1)[0]):]
+        if match.group(2) is not None:
+            return f"url({quote}{target}{rest}{quote})"
+        return f"@import {quote}{target}{rest}{quote}"
+
+    return fingerprint_urls(_CSS_URL_RE.sub(relative, css), assets)
+
+
+def asset_order(sources: list[Path]) -> list[Path]:
+    """Static files in fingerprinting order: everything else, then stylesheets after the ones they use.
+
+    A stylesheet's name hashes its rewritten content, so every asset it
+    references (other stylesheets included) must be fingerprinted first.
+    """
+    stylesheets = {f"/static/{p.relative_to(STATIC_DIR).as_posix()}": p for p in sources if p.suffix == ".css"}
+    graph = {
+        url: css_references(path.read_text(encoding="utf-8"), url.removeprefix("/static/")) & stylesheets.keys()
+        for url, path in stylesheets.items()
+    }
+    try:
+        css_order = list(TopologicalSorter(graph).static_order())
+    except CycleError as e:
+        raise SystemExit(f"Stylesheets import each other, can't fingerprint them: {' -> '.join(e.args[1])}")
+    return [p for p in sources if p.suffix != ".css"] + [stylesheets[url] for url in css_order]
+
+
+# --- Precompression ---
+
+def precompress(previous: dict[str, dict[str, str]] | None, outputs: dict[str, dict[str, str]]) -> tuple[int, int]:
+    """Write .br/.gz siblings of the compressible outputs. Returns (written, unchanged).
+
+    A sibling is reused while the output it was made from is unchanged. When
+    compressing doesn't pay off no sibling is written, and that is recorded
+    too, so the next build doesn't try again. Outputs that failed to build
+    (no inputs recorded) are skipped; their old siblings, if any, are kept
+    along with the old output.
+    """
+    written = unchanged = 0
+    for rel in sorted(outputs):
+        if PurePosixPath(rel).suffix not in COMPRESSIBLE_SUFFIXES:
+            continue
+        source = DIST_DIR / rel
+        if not outputs[rel] or not source.exists():
+            for ext in COMPRESSORS:
+                if previous and rel + ext in previous:
+                    outputs[rel + ext] = previous[rel + ext]
+            continue
+        inputs = {"source": _hash_file(source)}
+        skipped = {**inputs, "skipped": "1"}
+        data = None
+        for ext, compress in COMPRESSORS.items():
+            compressed_rel = rel + ext
+            if _is_fresh(previous, compressed_rel, inputs) or (previous or {}).get(compressed_rel) == skipped:
+                outputs[compressed_rel] = previous[compressed_rel]
+                unchanged += 1
+                continue
+            if compress is None:
+                continue
+            if data is None:
+                data = source.read_bytes()
+            compressed = compress(data)
+            target = DIST_DIR / compressed_rel
+            if len(compressed) > len(data) * COMPRESSION_MAX_RATIO:
+                target.unlink(missing_ok=True)
+                outputs[compressed_rel] = skipped
+            else:
+                target.write_bytes(compressed)
+                outputs[compressed_rel] = inputs
+                written += 1
+    return written, unchanged
+
+
+# --- Rendering ---
+
+def make_env() -> Environment:
+    return Environment(
         loader=FileSystemLoader(str(TEMPLATES_DIR)),
         autoescape=True,
     )
 
-    # Render pages for each language
-    for lang in LANGUAGES:
-        lang_dir = DIST_DIR / lang
-        lang_dir.mkdir(parents=True, exist_ok=True)
 
-        other_lang = "nl" if lang == "en" else "en"
-        other_lang_label = "Nederlands" if lang == "en" else "English"
+def render_page(env: Environment, template_name: str, lang: str, active: str, extra_ctx: dict,
+                assets: dict[str, str], used: set[str] | None = None) -> str:
+    """Render one page for the static site, links rewritten and assets fingerprinted.
 
-        for template_name, output_name, active, extra_ctx in PAGES:
-            template = env.get_template(template_name)
+    The /static/ URLs the page links to are added to `used`, if given.
+    """
+    template = env.get_template(template_name)
+
+    # Build the language-aware URL rewriter
+    # In static site, nav links point to /{lang}/page.html
+    context = {
+        "lang": lang,
+        "t": lambda key, _lang=lang, **kw: _t(key, _lang, **kw),
+        "other_lang": "nl" if lang == "en" else "en",
+        "other_lang_label": "Nederlands" if lang == "en" else "English",
+        "active": active,
+        **extra_ctx,
+    }
 
-            # Build the language-aware URL rewriter
-            # In static site, nav links point to /{lang}/page.html
-            context = {
-                "lang": lang,
-                "t": lambda key, _lang=lang, **kw: _t(key, _lang, **kw),
-                "other_lang": other_lang,
-                "other_lang_label": other_lang_label,
-                "active": active,
-                **extra_ctx,
-            }
+    html = template.render(**context)
 
-            html = template.render(**context)
+    # Rewrite internal links for static site
+    return fingerprint_urls(rewrite_links(html, lang), assets, used)
 
-            # Rewrite internal links for static site
-            html = rewrite_links(html, lang)
 
-            # Write output
-            output_path = lang_dir / output_name
-            output_path.write_text(html, encoding="utf-8")
-            print(f"  {lang}/{output_name}")
+_worker_env: Environment | None = None
+_worker_assets: dict[str, str] = {}
 
-    # Create root index.html that redirects to /nl/
-    root_index = DIST_DIR / "index.html"
-    root_index.write_text(
-        '<!DOCTYPE html>\n'
-        '<html>\n'
-        '<head>\n'
-        '  <meta charset="UTF-8">\n'
-        '  <meta http-equiv="refresh" content="0;url=/nl/">\n'
-        '  <script>document.location.href="/nl/";</script>\n'
-        '</head>\n'
-        '<body>\n'
-        '  <p>Redirecting to <a href="/nl/">Dutch version</a>...</p>\n'
-        '</body>\n'
-        '</html>\n',
-        encoding="utf-8",
-    )
-    print("  index.html (redirect -> /nl/)")
 
-    print(f"\nBuild complete! Output in {DIST_DIR}/")
+def _init_worker(assets: dict[str, str]) -> None:
+    # One environment per worker process, so its template cache is shared by all its jobs.
+    global _worker_env, _worker_assets
+    _worker_env = make_env()
+    _worker_assets = assets
+
+
+def _render_job(job: tuple, env: Environment | None = None,
+                assets: dict[str, str] | None = None) -> tuple[list[str], str | None]:
+    """Render and write one (template, output, lang, active, extra_ctx) job.
+
+    Returns the /static/ URLs the page links to and the error, if any.
+    """
+    template_name, output_name, lang, active, extra_ctx = job
+    used: set[str] = set()
+    try:
+        html = render_page(env or _worker_env, template_name, lang, active, extra_ctx,
+                           _worker_assets if assets is None else assets, used)
+        (DIST_DIR / lang / output_name).write_text(html, encoding="utf-8")
+    except Exception:
+        return [], traceback.format_exc()
+    return sorted(used), None
+
+
+def render_pages(jobs: list[tuple], workers: int, env: Environment,
+                 assets: dict[str, str]) -> list[tuple[list[str], str | None]]:
+    """Render jobs in this process (workers <= 1) or on a pool. Results are returned in job order."""
+    if workers <= 1 or len(jobs) <= 1:
+        return [_render_job(job, env, assets) for job in jobs]
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), initializer=_init_worker,
+                             initargs=(assets,)) as pool:
+        return list(pool.map(_render_job, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+
+
+def build(clean: bool = False, workers: int = 1):
+    """Build the static site, re-rendering and copying only what changed.
+
+    With workers > 1 the stale pages are rendered on a process pool.
+    """
+    previous = None if clean else load_manifest()
+    if previous is None and DIST_DIR.exists():
+        # No record of what dist/ contains: start from scratch.
+        shutil.rmtree(DIST_DIR)
+    DIST_DIR.mkdir(parents=True, exist_ok=True)
+
+    outputs: dict[str, dict[str, str]] = {}
+    rendered = copied = unchanged = 0
+
+    # Copy static files under fingerprinted names. CSS goes last, in dependency
+    # order: the URLs in it are fingerprinted first, so its own name follows
+    # the assets it uses.
+    assets: dict[str, str] = {}
+    for source in asset_order(sorted(p for p in STATIC_DIR.rglob("*") if p.is_file())):
+        name = source.relative_to(STATIC_DIR).as_posix()
+        if source.suffix == ".css":
+            content = fingerprint_css(source.read_text(encoding="utf-8"), name, assets).encode()
+            digest = _digest(content)
+        else:
+            content, digest = None, _hash_file(source)
+        rel = f"static/{fingerprinted_name(name, digest)}"
+        assets[f"/static/{name}"] = f"/{rel}"
+        inputs = {"source": digest}
+        outputs[rel] = inputs
+        if _is_fresh(previous, rel, inputs):
+            unchanged += 1
+            continue
+        target = DIST_DIR / rel
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if content is None:
+            shutil.copy2(source, target)
+        else:
+            target.write_bytes(content)
+        copied += 1
+    print(f"Copied {copied} changed file(s) from static/ -> dist/static/")
+
+    asset_manifest = json.dumps(assets, indent=1, sort_keys=True) + "\n"
+    inputs = {"source": _digest(asset_manifest.encode())}
+    outputs[ASSET_MANIFEST] = inputs
+    if not _is_fresh(previous, ASSET_MANIFEST, inputs):
+        (DIST_DIR / ASSET_MANIFEST).write_text(asset_manifest, encoding="utf-8")
+
+    env = make_env()
+    builder = _builder_hash()
+
+    # Render pages for each language. A page is fresh if its templates,
+    # strings and context are unchanged and the assets it linked to last
+    # time still have the same fingerprinted URLs.
+    jobs = []
+    stale_inputs: dict[str, dict[str, str]] = {}
+    for lang in LANGUAGES:
+        (DIST_DIR / lang).mkdir(parents=True, exist_ok=True)
+        for template_name, output_name, active, extra_ctx in PAGES:
+            rel = f"{lang}/{output_name}"
+            inputs = page_inputs(env, template_name, lang, {"active": active, **extra_ctx}, builder)
+            outputs[rel] = {**inputs, **asset_inputs(recorded_assets(previous, rel), assets)}
+            if _is_fresh(previous, rel, outputs[rel]):
+                unchanged += 1
+            else:
+                jobs.append((template_name, output_name, lang, active, extra_ctx))
+                stale_inputs[rel] = inputs
+
+    errors = []
+    for (template_name, output_name, lang, *_), (used, error) in zip(jobs, render_pages(jobs, workers, env, assets)):
+        rel = f"{lang}/{output_name}"
+        if error is None:
+            outputs[rel] = {**stale_inputs[rel], **asset_inputs(used, assets)}
+            rendered += 1
+            print(f"  {rel}")
+        else:
+            errors.append(f"{rel} ({template_name}):\n{error}")
+            # Keep the old output, but make sure the next build retries it.
+            outputs[rel] = {}
+
+    # Create root index.html that redirects to /nl/
+    inputs = {"source": _digest(ROOT_INDEX_HTML.encode())}
+    outputs["index.html"] = inputs
+    if _is_fresh(previous, "index.html", inputs):
+        unchanged += 1
+    else:
+        (DIST_DIR / "index.html").write_text(ROOT_INDEX_HTML, encoding="utf-8")
+        rendered += 1
+        print("  index.html (redirect -> /nl/)")
+
+    if brotli is None:
+        print("brotli is not installed: not writing .br files")
+    compressed, compressed_unchanged = precompress(previous, outputs)
+    unchanged += compressed_unchanged
+
+    removed = _remove_stale(previous, outputs) if previous is not None else 0
+    save_manifest(outputs)
+
+    if errors:
+        for error in errors:
+            print(f"\nFailed to render {error}")
+        raise SystemExit(f"\nBuild failed: {len(errors)} page(s) could not be rendered")
+    print(f"\nBuild complete! Output in {DIST_DIR}/ "
+          f"({rendered} rendered, {copied} copied, {compressed} compressed, {unchanged} unchanged, "
+          f"{removed} removed)")
+
+
+# Flask routes -> static page file, under /{lang}/
+PAGE_ROUTES = {
+    "/dash": "dash.html",
+    "/perch": "perch.html",
+    "/cache": "cache.html",
+    "/waitlist": "waitlist.html",
+    "/subscribe": "subscribe.html",
+}
+# HTMX form posts -> API endpoints
+API_ROUTES = {
+    "/waitlist": "/api/waitlist",
+    "/subscribe": "/api/subscribe",
+}
+
+# Every rewritten attribute in one pattern, so a page is scanned once. It has
+# no groups (they slow the scan down); the replacement looks the link up.
+_LINK_RE = re.compile(
+    r'(?:href|hx-post)="/(?:'
+    + "|".join(re.escape(route.lstrip("/")) for route in dict.fromkeys([*PAGE_ROUTES, *API_ROUTES]))
+    + "".join(f"|lang/{lang}" for lang in LANGUAGES)
+    + r')?(?:#[^"]*)?"'
+)
+
+
+@functools.cache
+def _link_replacer(lang: str):
+    # Whole links (closing quote included) -> rewritten, so most matches are one dict lookup.
+    links = {f'href="{route}"': f'href="/{lang}/{page}"' for route, page in PAGE_ROUTES.items()}
+    links.update({f'href="/lang/{other}"': f'href="/{other}/"' for other in LANGUAGES if other != lang})
+    links['href="/"'] = f'href="/{lang}/"'
+    links.update({f'hx-post="{route}"': f'hx-post="{api}"' for route, api in API_ROUTES.items()})
+    # Page links keep a #fragment; anything else matched with one is left alone.
+    with_fragment = {f'href="{route}': f'href="/{lang}/{page}' for route, page in PAGE_ROUTES.items()}
+
+    def replace(match: re.Match) -> str:
+        link = match.group(0)
+        rewritten = links.get(link)
+        if rewritten is None and "#" in link:
+            target, fragment = link.split("#", 1)
+            if target in with_fragment:
+                return f"{with_fragment[target]}#{fragment}"
+        return rewritten or link
+
+    return replace
 
 
 def rewrite_links(html: str, lang: str) -> str:
@@ -123,7 +580,8 @@ def rewrite_links(html: str, lang: str) -> str:
     - href="/cache"      -> href="/{lang}/cache.html"
     - href="/waitlist"   -> href="/{lang}/waitlist.html"
     - href="/subscribe"  -> href="/{lang}/subscribe.html"
-    - href="/lang/{other}" -> href="/{other_lang}/current_page" (handled per-page)
+      (also with a #fragment, which is kept)
+    - href="/lang/{other}" -> href="/{other_lang}/"
     - hx-post="/waitlist"  -> hx-post="/api/waitlist"
     - hx-post="/subscribe" -> hx-post="/api/subscribe"
 
@@ -133,47 +591,13 @@ def rewrite_links(html: str, lang: str) -> str:
     - Anchor links (#...)
     - mailto: links
     """
-    import re
-
-    other_lang = "nl" if lang == "en" else "en"
-
-    # Rewrite HTMX form posts to API endpoints
-    html = html.replace('hx-post="/waitlist"', 'hx-post="/api/waitlist"')
-    html = html.replace('hx-post="/subscribe"', 'hx-post="/api/subscribe"')
-
-    # Rewrite language switcher: /lang/{other} -> /{other_lang}/ (same page)
-    # The language switcher link in the nav just needs to point to the other language root
-    # We use a regex to handle this properly
-    html = re.sub(
-        r'href="/lang/' + re.escape(other_lang) + r'"',
-        f'href="/{other_lang}/"',
-        html,
-    )
-
-    # Rewrite internal page links (but not /static/, external, anchors, mailto)
-    # Map of Flask routes to static file paths
-    page_routes = {
-        "/dash": f"/{lang}/dash.html",
-        "/perch": f"/{lang}/perch.html",
-        "/cache": f"/{lang}/cache.html",
-        "/waitlist": f"/{lang}/waitlist.html",
-        "/subscribe": f"/{lang}/subscribe.html",
-    }
-
-    for route, static_path in page_routes.items():
-        # Match href="/dash" or href="/dash#demo" (with optional fragment)
-        html = re.sub(
-            r'href="' + re.escape(route) + r'(#[^"]*)?"',
-            lambda m, sp=static_path: f'href="{sp}{m.group(1) or ""}"',
-            html,
-        )
-
-    # Rewrite root href="/" to href="/{lang}/"
-    # Be careful not to match /static/ etc. - only exact href="/"
-    html = re.sub(r'href="/"', f'href="/{lang}/"', html)
-
-    return html
+    return _LINK_RE.sub(_link_replacer(lang), html)
 
 
 if __name__ == "__main__":
-    build()
+    parser = argparse.ArgumentParser(description="Build the static site into dist/")
+    parser.add_argument("--clean", action="store_true", help="ignore the manifest and rebuild everything")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="render pages on this many processes (0: one per CPU)")
+    args = parser.parse_args()
+    build(clean=args.clean, workers=args.jobs or os.cpu_count() or 1)
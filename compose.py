@@ -0,0 +1,241 @@
+"""Newsletter body compilation: Markdown -> email-safe HTML + plain text.
+
+Runs once when a newsletter is saved (database.create_newsletter /
+update_newsletter); preview and send only read the stored output.
+
+Many email clients ignore <style> blocks, so the house stylesheet
+(EMAIL_STYLES) and any simple rules from <style> blocks in the body are
+written into style attributes. Supported selectors are tag, .class,
+tag.class and #id; blocks with anything else (@media, combinators) are
+kept as they are for the clients that do read them.
+
+Markdown needs the `markdown` package (requirements.txt). It is imported
+on first use, so processes that never save newsletters (the API) don't
+need it.
+"""
+
+import re
+from html import escape
+from html.parser import HTMLParser
+from typing import NamedTuple
+
+FORMATS = ("markdown", "html")
+
+# Tag -> inline style, applied under any style the body sets itself.
+EMAIL_STYLES = {
+    "h1": "font-size: 1.5rem; line-height: 1.3; margin: 0 0 0.75rem;",
+    "h2": "font-size: 1.25rem; line-height: 1.3; margin: 0 0 0.5rem;",
+    "h3": "font-size: 1.05rem; line-height: 1.3; margin: 0 0 0.5rem;",
+    "p": "margin: 0 0 0.9rem; line-height: 1.6; color: #4a4a4a;",
+    "ul": "margin: 0 0 0.9rem; padding-left: 1.25rem; color: #4a4a4a;",
+    "ol": "margin: 0 0 0.9rem; padding-left: 1.25rem; color: #4a4a4a;",
+    "li": "margin: 0 0 0.3rem; line-height: 1.6;",
+    "a": "color: #1a1a1a; text-decoration: underline;",
+    "blockquote": "margin: 0 0 0.9rem; padding-left: 1rem; border-left: 3px solid #f0e51b; color: #717171;",
+    "code": "font-family: Menlo, Monaco, monospace; font-size: 0.9em; background: #f5f5f5; padding: 0 0.2em;",
+    "pre": "background: #f5f5f5; padding: 0.75rem; overflow-x: auto; margin: 0 0 0.9rem;",
+    "img": "max-width: 100%; height: auto;",
+    "hr": "border: 0; border-top: 1px solid #e5e5e5; margin: 1.5rem 0;",
+    "table": "border-collapse: collapse; margin: 0 0 0.9rem;",
+    "th": "border-bottom: 1px solid #e5e5e5; padding: 0.3rem 0.6rem; text-align: left;",
+    "td": "border-bottom: 1px solid #e5e5e5; padding: 0.3rem 0.6rem;",
+}
+
+
+class CompiledBody(NamedTuple):
+    html: str
+    text: str
+
+
+def compile_body(source: str, body_format: str = "markdown") -> CompiledBody:
+    """Compile a newsletter body as saved in the editor."""
+    if body_format not in FORMATS:
+        raise ValueError(f"Unknown body format {body_format!r}; expected one of {', '.join(FORMATS)}")
+    html = markdown_to_html(source) if body_format == "markdown" else source
+    html = inline_css(html)
+    return CompiledBody(html, html_to_text(html))
+
+
+def markdown_to_html(source: str) -> str:
+    import markdown
+
+    return markdown.markdown(source, extensions=["extra", "sane_lists"], output_format="html")
+
+
+# --- CSS inlining ---
+
+_STYLE_BLOCK_RE = re.compile(r"<style[^>]*>(.*?)</style>", re.IGNORECASE | re.DOTALL)
+_COMMENT_RE = re.compile(r"/\*.*?\*/", re.DOTALL)
+_AT_RULE_RE = re.compile(r"@[^{};]*(?:;|\{(?:[^{}]*\{[^{}]*\})*[^{}]*\})")
+_RULE_RE = re.compile(r"([^{}@]+)\{([^{}]*)\}")
+_SELECTOR_RE = re.compile(r"^(?:([a-z][a-z0-9]*)?(?:\.([\w-]+))?|#([\w-]+))$", re.IGNORECASE)
+
+
+class _Rule(NamedTuple):
+    specificity: tuple[int, int, int, int]  # (id, class, tag, source order)
+    tag: str | None
+    cls: str | None
+    id: str | None
+    declarations: str
+
+
+def _parse_style_block(css: str, order: int) -> tuple[list[_Rule], bool]:
+    """Rules with supported selectors, and whether anything in the block was left over."""
+    css = _COMMENT_RE.sub("", css)
+    css, at_rules = _AT_RULE_RE.subn("", css)
+    rules = []
+    leftover = at_rules > 0
+    for selectors, declarations in _RULE_RE.findall(css):
+        declarations = declarations.strip().rstrip(";")
+        for selector in selectors.split(","):
+            match = _SELECTOR_RE.match(selector.strip())
+            if not match or not any(match.groups()):
+                leftover = True
+                continue
+            tag, cls, id_ = match.groups()
+            order += 1
+            rules.append(_Rule((bool(id_), bool(cls), bool(tag), order), tag and tag.lower(), cls, id_,
+                               declarations))
+    return rules, leftover
+
+
+class _Inliner(HTMLParser):
+    def __init__(self, rules: list[_Rule]):
+        super().__init__(convert_charrefs=False)
+        self.rules = sorted(rules)
+        self.out: list[str] = []
+
+    def _styled(self, tag: str, attrs: list[tuple[str, str | None]]) -> str:
+        attrs = dict(attrs)
+        classes = (attrs.get("class") or "").split()
+        styles = [EMAIL_STYLES[tag]] if tag in EMAIL_STYLES else []
+        styles += [
+            rule.declarations + ";" for rule in self.rules
+            if (rule.tag is None or rule.tag == tag)
+            and (rule.cls is None or rule.cls in classes)
+            and (rule.id is None or rule.id == attrs.get("id"))
+        ]
+        if attrs.get("style"):
+            styles.append(attrs["style"])
+        if styles:
+            attrs["style"] = " ".join(styles)
+        rendered = "".join(
+            f" {name}" if value is None else f' {name}="{escape(value)}"' for name, value in attrs.items()
+        )
+        return f"<{tag}{rendered}"
+
+    def handle_starttag(self, tag, attrs):
+        self.out.append(self._styled(tag, attrs) + ">")
+
+    def handle_startendtag(self, tag, attrs):
+        self.out.append(self._styled(tag, attrs) + " />")
+
+    def handle_endtag(self, tag):
+        self.out.append(f"</{tag}>")
+
+    def handle_data(self, data):
+        self.out.append(data)
+
+    def handle_entityref(self, name):
+        self.out.append(f"&{name};")
+
+    def handle_charref(self, name):
+        self.out.append(f"&#{name};")
+
+    def handle_comment(self, data):
+        self.out.append(f"<!--{data}-->")
+
+    def handle_decl(self, decl):
+        self.out.append(f"<!{decl}>")
+
+    def handle_pi(self, data):
+        self.out.append(f"<?{data}>")
+
+
+def inline_css(html: str) -> str:
+    """Write EMAIL_STYLES and simple <style> rules into style attributes."""
+    rules: list[_Rule] = []
+
+    def take_block(match: re.Match) -> str:
+        block_rules, leftover = _parse_style_block(match.group(1), len(rules))
+        rules.extend(block_rules)
+        return match.group(0) if leftover else ""
+
+    html = _STYLE_BLOCK_RE.sub(take_block, html)
+    inliner = _Inliner(rules)
+    inliner.feed(html)
+    inliner.close()
+    return "".join(inliner.out)
+
+
+# --- Text part ---
+
+_BLOCK_TAGS = {"p", "div", "h1", "h2", "h3", "h4", "h5", "h6", "ul", "ol", "blockquote", "pre", "table", "tr", "hr"}
+_INDENT = "\x01"  # indentation to keep (lists, <pre>) when the other lines are stripped
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out: list[str] = []
+        self._skip = 0
+        self._pre = 0
+        self._links: list[tuple[str | None, int]] = []  # (href, index in out)
+        self._list_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("style", "script", "head"):
+            self._skip += 1
+        elif tag in ("ul", "ol") and self._list_depth:
+            self._list_depth += 1
+        elif tag in _BLOCK_TAGS:
+            self.out.append("\n\n")
+            if tag == "pre":
+                self._pre += 1
+            elif tag in ("ul", "ol"):
+                self._list_depth += 1
+            elif tag == "hr":
+                self.out.append("----\n\n")
+        elif tag == "li":
+            self.out.append("\n" + _INDENT * 2 * max(0, self._list_depth - 1) + "- ")
+        elif tag == "br":
+            self.out.append("\n")
+        elif tag == "a":
+            self._links.append((dict(attrs).get("href"), len(self.out)))
+        elif tag in ("td", "th"):
+            self.out.append("  ")
+
+    def handle_endtag(self, tag):
+        if tag in ("style", "script", "head"):
+            self._skip = max(0, self._skip - 1)
+        elif tag in ("ul", "ol") and self._list_depth > 1:
+            self._list_depth -= 1
+        elif tag in _BLOCK_TAGS:
+            if tag == "pre":
+                self._pre = max(0, self._pre - 1)
+            elif tag in ("ul", "ol"):
+                self._list_depth = max(0, self._list_depth - 1)
+            self.out.append("\n\n")
+        elif tag == "a" and self._links:
+            href, start = self._links.pop()
+            label = "".join(self.out[start:]).strip()
+            if href and not href.startswith(("#", "mailto:")) and href != label:
+                self.out.append(f" ({href})")
+
+    def handle_data(self, data):
+        if self._skip:
+            return
+        if self._pre:
+            self.out.append(re.sub(r"(?m)^ +", lambda m: _INDENT * len(m.group()), data))
+        else:
+            self.out.append(re.sub(r"\s+", " ", data))
+
+
+def html_to_text(html: str) -> str:
+    """Plain-text alternative of a body: paragraphs, list bullets and link URLs kept."""
+    extractor = _TextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    text = "".join(extractor.out)
+    text = "\n".join(line.strip() for line in text.split("\n")).replace(_INDENT, " ")
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
@@ -1,26 +1,196 @@
 """Database for Siskin Labs website (waitlist + mailing list)."""
 
+import base64
+import json
 import sqlite3
 import os
+import queue
 import secrets
-from datetime import datetime
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+import compose
 
 DB_PATH = os.environ.get("WEBSITE_DB_PATH", "website.db")
 
+# Idle connections kept per worker process. Checkouts beyond this open a
+# temporary connection that is closed on return instead of being pooled.
+POOL_SIZE = int(os.environ.get("WEBSITE_DB_POOL_SIZE", "4"))
+
+# Opt-in group commit for signups: waitlist and subscribe writes are
+# funnelled through one writer thread that commits them in batches. It only
+# pays off when every commit is fsynced (synchronous=FULL, the "safe" and
+# "legacy" profiles): benchmarks/bench_signup_batching.py measured 1.87x
+# there, but 0.27x on "balanced", where WAL commits are cheap and the batch
+# window is pure added latency. init_db() warns about that combination.
+WRITE_BATCHING = os.environ.get("WEBSITE_DB_WRITE_BATCHING", "").lower() in ("1", "true", "yes")
+WRITE_BATCH_WINDOW_MS = float(os.environ.get("WEBSITE_DB_WRITE_BATCH_WINDOW_MS", "5"))
+WRITE_BATCH_MAX = 256
+
+# Named sets of per-connection pragmas, selected with WEBSITE_DB_PROFILE.
+# WAL is always on. cache_size is negative KiB per connection, so keep
+# POOL_SIZE x cache_size well inside the 256 MB VM.
+PROFILES: dict[str, dict[str, int | str]] = {
+    # What get_db() did before profiles existed: SQLite's defaults.
+    "legacy": {},
+    # Every commit fsynced; waits out lock contention instead of failing.
+    "safe": {
+        "busy_timeout": 5000,
+        "synchronous": "FULL",
+        "cache_size": -4000,
+        "temp_store": "MEMORY",
+        "wal_autocheckpoint": 1000,
+    },
+    # WAL with synchronous=NORMAL cannot corrupt the database; a power loss
+    # may drop the last few commits. The sensible default for this site.
+    "balanced": {
+        "busy_timeout": 5000,
+        "synchronous": "NORMAL",
+        "cache_size": -8000,
+        "temp_store": "MEMORY",
+        "mmap_size": 64 * 1024 * 1024,
+        "wal_autocheckpoint": 1000,
+    },
+    # Launch-day settings: bigger cache and mmap, rarer checkpoints.
+    "throughput": {
+        "busy_timeout": 10000,
+        "synchronous": "NORMAL",
+        "cache_size": -16000,
+        "temp_store": "MEMORY",
+        "mmap_size": 128 * 1024 * 1024,
+        "wal_autocheckpoint": 4000,
+    },
+}
+DB_PROFILE = os.environ.get("WEBSITE_DB_PROFILE", "balanced")
+
+_pool: queue.LifoQueue = queue.LifoQueue(maxsize=POOL_SIZE)
+_pool_pid = os.getpid()
+_pool_lock = threading.Lock()
+
 
-def get_db() -> sqlite3.Connection:
-    """Get a database connection."""
-    conn = sqlite3.connect(DB_PATH)
+def _connect() -> sqlite3.Connection:
+    """Open and configure a new connection.
+
+    check_same_thread is off because a pooled connection is handed to
+    whichever thread checks it out next. A connection is only ever used
+    by one thread at a time: it lives in the pool or in a single checkout.
+    """
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    # Only takes effect on a brand-new file, so it must precede the WAL switch;
+    # older databases are converted with enable_incremental_vacuum().
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
     conn.execute("PRAGMA journal_mode=WAL")
+    for pragma, value in PROFILES[DB_PROFILE].items():
+        conn.execute(f"PRAGMA {pragma} = {value}")
     return conn
 
 
-def init_db():
-    """Initialize the database schema."""
-    conn = get_db()
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS waitlist (
+def _checkout() -> sqlite3.Connection:
+    global _pool, _pool_pid
+    if _pool_pid != os.getpid():
+        # Forked worker: never share sqlite handles with the parent.
+        with _pool_lock:
+            if _pool_pid != os.getpid():
+                _pool = queue.LifoQueue(maxsize=POOL_SIZE)
+                _pool_pid = os.getpid()
+    try:
+        return _pool.get_nowait()
+    except queue.Empty:
+        return _connect()
+
+
+def _checkin(conn: sqlite3.Connection) -> None:
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+    except sqlite3.Error:
+        conn.close()
+        return
+    try:
+        _pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+
+@contextmanager
+def get_db():
+    """Check out a pooled connection for the duration of a with-block.
+
+    Uncommitted work is rolled back when the connection is returned.
+    """
+    conn = _checkout()
+    try:
+        yield conn
+    finally:
+        _checkin(conn)
+
+
+def close_pool() -> None:
+    """Close all idle pooled connections (shutdown, or after changing DB_PATH)."""
+    while True:
+        try:
+            _pool.get_nowait().close()
+        except queue.Empty:
+            return
+
+
+# Rebuilds subscriber_counts/waitlist_counts from the base tables. Shared by
+# the migration that introduces the counters and by reconcile_counters().
+_COUNTER_REBUILD = (
+    "DELETE FROM subscriber_counts",
+    """INSERT INTO subscriber_counts (interests, language, confirmed, n)
+       SELECT COALESCE(interests, 'all'), COALESCE(language, ''), COALESCE(confirmed, 0), COUNT(*)
+       FROM subscribers GROUP BY 1, 2, 3""",
+    "DELETE FROM waitlist_counts",
+    """INSERT INTO waitlist_counts (product, language, n)
+       SELECT product, COALESCE(language, ''), COUNT(*) FROM waitlist GROUP BY 1, 2""",
+)
+
+# Keep subscriber_counts in step with subscribers. A NULL interests column
+# counts as 'all', as in recipient resolution (_split_interests).
+_SUBSCRIBER_COUNT_TRIGGERS = (
+    """CREATE TRIGGER subscribers_count_insert AFTER INSERT ON subscribers BEGIN
+        INSERT INTO subscriber_counts (interests, language, confirmed, n)
+        VALUES (COALESCE(NEW.interests, 'all'), COALESCE(NEW.language, ''), COALESCE(NEW.confirmed, 0), 1)
+        ON CONFLICT DO UPDATE SET n = n + 1;
+    END""",
+    """CREATE TRIGGER subscribers_count_delete AFTER DELETE ON subscribers BEGIN
+        UPDATE subscriber_counts SET n = n - 1
+        WHERE interests = COALESCE(OLD.interests, 'all') AND language = COALESCE(OLD.language, '')
+          AND confirmed = COALESCE(OLD.confirmed, 0);
+    END""",
+    """CREATE TRIGGER subscribers_count_update AFTER UPDATE OF interests, language, confirmed ON subscribers
+    WHEN OLD.interests IS NOT NEW.interests OR OLD.language IS NOT NEW.language
+      OR OLD.confirmed IS NOT NEW.confirmed
+    BEGIN
+        UPDATE subscriber_counts SET n = n - 1
+        WHERE interests = COALESCE(OLD.interests, 'all') AND language = COALESCE(OLD.language, '')
+          AND confirmed = COALESCE(OLD.confirmed, 0);
+        INSERT INTO subscriber_counts (interests, language, confirmed, n)
+        VALUES (COALESCE(NEW.interests, 'all'), COALESCE(NEW.language, ''), COALESCE(NEW.confirmed, 0), 1)
+        ON CONFLICT DO UPDATE SET n = n + 1;
+    END""",
+)
+
+
+def _split_interests(column: str) -> str:
+    """SQL table-valued expression splitting a comma-separated interests column."""
+    return f"""json_each('["' || replace(COALESCE({column}, 'all'), ',', '","') || '"]')"""
+
+
+# Schema migrations, applied in order. The schema version is stored in
+# PRAGMA user_version, so each database only runs the steps it is missing.
+# Never edit a migration that has shipped; append a new one instead.
+MIGRATIONS: list[tuple[str, ...]] = [
+    # 1: initial schema (IF NOT EXISTS so pre-migration databases adopt it)
+    (
+        """CREATE TABLE IF NOT EXISTS waitlist (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             email TEXT NOT NULL UNIQUE,
             name TEXT,
@@ -28,10 +198,8 @@ def init_db():
             language TEXT DEFAULT 'en',
             ip_address TEXT,
             created_at TEXT NOT NULL
-        )
-    """)
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS subscribers (
+        )""",
+        """CREATE TABLE IF NOT EXISTS subscribers (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             email TEXT NOT NULL UNIQUE,
             name TEXT,
@@ -43,10 +211,8 @@ def init_db():
             ip_address TEXT,
             created_at TEXT NOT NULL,
             confirmed_at TEXT
-        )
-    """)
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS newsletters (
+        )""",
+        """CREATE TABLE IF NOT EXISTS newsletters (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             subject_en TEXT NOT NULL,
             subject_nl TEXT NOT NULL,
@@ -58,72 +224,634 @@ def init_db():
             scheduled_at TEXT,
             sent_at TEXT,
             sent_count INTEGER DEFAULT 0
+        )""",
+    ),
+    # 2: token and segment lookups
+    (
+        # Confirm tokens are cleared on confirmation, so only pending rows are indexed.
+        """CREATE UNIQUE INDEX IF NOT EXISTS idx_subscribers_confirm_token
+           ON subscribers (confirm_token) WHERE confirm_token IS NOT NULL""",
+        """CREATE UNIQUE INDEX IF NOT EXISTS idx_subscribers_unsubscribe_token
+           ON subscribers (unsubscribe_token)""",
+        # Covers recipient resolution for a send without touching the table.
+        """CREATE INDEX IF NOT EXISTS idx_subscribers_confirmed_interests
+           ON subscribers (interests, id, email, language, unsubscribe_token) WHERE confirmed = 1""",
+        """CREATE INDEX IF NOT EXISTS idx_newsletters_created_at
+           ON newsletters (created_at)""",
+    ),
+    # 3: maintained counters, kept in step with the base tables by triggers
+    (
+        """CREATE TABLE subscriber_counts (
+            interests TEXT NOT NULL,
+            language TEXT NOT NULL,
+            confirmed INTEGER NOT NULL,
+            n INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (interests, language, confirmed)
+        ) WITHOUT ROWID""",
+        """CREATE TABLE waitlist_counts (
+            product TEXT NOT NULL,
+            language TEXT NOT NULL,
+            n INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (product, language)
+        ) WITHOUT ROWID""",
+        *_SUBSCRIBER_COUNT_TRIGGERS,
+        """CREATE TRIGGER waitlist_count_insert AFTER INSERT ON waitlist BEGIN
+            INSERT INTO waitlist_counts (product, language, n)
+            VALUES (NEW.product, COALESCE(NEW.language, ''), 1)
+            ON CONFLICT DO UPDATE SET n = n + 1;
+        END""",
+        """CREATE TRIGGER waitlist_count_delete AFTER DELETE ON waitlist BEGIN
+            UPDATE waitlist_counts SET n = n - 1
+            WHERE product = OLD.product AND language = COALESCE(OLD.language, '');
+        END""",
+        """CREATE TRIGGER waitlist_count_update AFTER UPDATE OF product, language ON waitlist
+        WHEN OLD.product IS NOT NEW.product OR OLD.language IS NOT NEW.language
+        BEGIN
+            UPDATE waitlist_counts SET n = n - 1
+            WHERE product = OLD.product AND language = COALESCE(OLD.language, '');
+            INSERT INTO waitlist_counts (product, language, n)
+            VALUES (NEW.product, COALESCE(NEW.language, ''), 1)
+            ON CONFLICT DO UPDATE SET n = n + 1;
+        END""",
+        # Backfill from existing rows.
+        *_COUNTER_REBUILD,
+    ),
+    # 4: multi-interest subscriptions. subscribers.interests becomes a canonical
+    # comma-separated list (see normalize_interests); the junction table mirrors
+    # it, maintained by triggers, so targeting is an index range scan per interest.
+    (
+        """CREATE TABLE subscriber_interests (
+            interest TEXT NOT NULL,
+            subscriber_id INTEGER NOT NULL,
+            PRIMARY KEY (interest, subscriber_id)
+        ) WITHOUT ROWID""",
+        """CREATE INDEX idx_subscriber_interests_subscriber
+           ON subscriber_interests (subscriber_id)""",
+        f"""INSERT INTO subscriber_interests (interest, subscriber_id)
+            SELECT j.value, s.id FROM subscribers s, {_split_interests("s.interests")} j
+            WHERE j.value != ''""",
+        f"""CREATE TRIGGER subscribers_interests_insert AFTER INSERT ON subscribers BEGIN
+            INSERT OR IGNORE INTO subscriber_interests (interest, subscriber_id)
+            SELECT value, NEW.id FROM {_split_interests("NEW.interests")} WHERE value != '';
+        END""",
+        f"""CREATE TRIGGER subscribers_interests_update AFTER UPDATE OF interests ON subscribers
+        WHEN OLD.interests IS NOT NEW.interests
+        BEGIN
+            DELETE FROM subscriber_interests WHERE subscriber_id = NEW.id;
+            INSERT OR IGNORE INTO subscriber_interests (interest, subscriber_id)
+            SELECT value, NEW.id FROM {_split_interests("NEW.interests")} WHERE value != '';
+        END""",
+        """CREATE TRIGGER subscribers_interests_delete AFTER DELETE ON subscribers BEGIN
+            DELETE FROM subscriber_interests WHERE subscriber_id = OLD.id;
+        END""",
+        "DROP INDEX IF EXISTS idx_subscribers_confirmed_interests",
+    ),
+    # 5: retention sweeps over pending sign-ups
+    (
+        """CREATE INDEX idx_subscribers_unconfirmed_created_at
+           ON subscribers (created_at) WHERE confirmed = 0""",
+    ),
+    # 6: durable mail outbox (see outbox.py)
+    (
+        """CREATE TABLE outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            recipient TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TEXT NOT NULL,
+            last_error TEXT,
+            created_at TEXT NOT NULL,
+            sent_at TEXT
+        )""",
+        """CREATE INDEX idx_outbox_due ON outbox (next_attempt_at) WHERE status = 'pending'""",
+    ),
+    # 7: background newsletter sends (see dispatch.py)
+    (
+        """CREATE TABLE send_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            newsletter_id INTEGER NOT NULL REFERENCES newsletters(id),
+            status TEXT NOT NULL DEFAULT 'running',
+            total INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            finished_at TEXT
+        )""",
+        "CREATE INDEX idx_send_jobs_newsletter_id ON send_jobs (newsletter_id)",
+    ),
+    # 8: per-recipient delivery log, so interrupted sends resume where they stopped
+    (
+        """CREATE TABLE newsletter_deliveries (
+            newsletter_id INTEGER NOT NULL REFERENCES newsletters(id),
+            subscriber_id INTEGER NOT NULL,
+            delivered_at TEXT NOT NULL,
+            PRIMARY KEY (newsletter_id, subscriber_id)
+        ) WITHOUT ROWID""",
+    ),
+    # 9: compiled newsletter bodies (see compose.py); existing rows are HTML and
+    # are compiled by init_db()
+    (
+        "ALTER TABLE newsletters ADD COLUMN body_format TEXT NOT NULL DEFAULT 'html'",
+        "ALTER TABLE newsletters ADD COLUMN html_en TEXT",
+        "ALTER TABLE newsletters ADD COLUMN html_nl TEXT",
+        "ALTER TABLE newsletters ADD COLUMN text_en TEXT",
+        "ALTER TABLE newsletters ADD COLUMN text_nl TEXT",
+    ),
+    # 10: confirmation resend cooldown
+    (
+        "ALTER TABLE subscribers ADD COLUMN last_confirmation_sent_at TEXT",
+        """CREATE TABLE mail_counters (
+            name TEXT PRIMARY KEY,
+            n INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID""",
+    ),
+    # 11: count subscribers with NULL interests under 'all' instead of ''
+    (
+        "DROP TRIGGER subscribers_count_insert",
+        "DROP TRIGGER subscribers_count_delete",
+        "DROP TRIGGER subscribers_count_update",
+        *_SUBSCRIBER_COUNT_TRIGGERS,
+        *_COUNTER_REBUILD,
+    ),
+]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    """Return the migration version a database is at."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Apply any pending migrations in one transaction. Returns the new version.
+
+    BEGIN IMMEDIATE takes the write lock before the version is read, so
+    workers starting at the same time don't race each other.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        current = schema_version(conn)
+        if current > len(MIGRATIONS):
+            raise RuntimeError(
+                f"Database schema version {current} is newer than this code ({len(MIGRATIONS)})"
+            )
+        for version, statements in enumerate(MIGRATIONS[current:], start=current + 1):
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return len(MIGRATIONS)
+
+
+# Keyword settings read back as numbers, and the same keyword means a
+# different number per pragma (FULL is 2 for synchronous, 1 for auto_vacuum).
+_PRAGMA_KEYWORDS = {
+    "synchronous": {"OFF": 0, "NORMAL": 1, "FULL": 2, "EXTRA": 3},
+    "temp_store": {"DEFAULT": 0, "FILE": 1, "MEMORY": 2},
+    "auto_vacuum": {"NONE": 0, "FULL": 1, "INCREMENTAL": 2},
+}
+
+
+def check_profile(conn: sqlite3.Connection) -> None:
+    """Verify that the configured profile's pragmas took effect on a connection."""
+    for pragma, value in PROFILES[DB_PROFILE].items():
+        if pragma == "mmap_size":
+            continue  # capped by SQLITE_MAX_MMAP_SIZE, may legitimately read back lower
+        actual = conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+        expected = _PRAGMA_KEYWORDS.get(pragma, {}).get(value, value) if isinstance(value, str) else value
+        if actual != expected:
+            raise ValueError(f"PRAGMA {pragma} is {actual!r}, profile {DB_PROFILE!r} expects {value!r}")
+
+
+def init_db():
+    """Initialize the database schema."""
+    if DB_PROFILE not in PROFILES:
+        raise ValueError(
+            f"Unknown WEBSITE_DB_PROFILE {DB_PROFILE!r}; expected one of {', '.join(PROFILES)}"
         )
-    """)
-    conn.commit()
-    conn.close()
+    with get_db() as conn:
+        check_profile(conn)
+        if WRITE_BATCHING and conn.execute("PRAGMA synchronous").fetchone()[0] < 2:
+            print(f"[db] WEBSITE_DB_WRITE_BATCHING is on, but profile {DB_PROFILE!r} doesn't fsync "
+                  "every commit; group commit only adds latency there. Use 'safe' or turn it off.")
+        migrate(conn)
+        _compile_newsletters(conn)
 
 
-def add_to_waitlist(email: str, name: str = "", product: str = "both",
-                    language: str = "en", ip_address: str = "") -> bool:
-    """Add an email to the waitlist. Returns True if added, False if exists."""
-    conn = get_db()
+# --- Maintenance ---
+
+# Unconfirmed sign-ups older than this are deleted by run_maintenance().
+UNCONFIRMED_MAX_AGE_DAYS = int(os.environ.get("WEBSITE_UNCONFIRMED_MAX_AGE_DAYS", "14"))
+# Sent and given-up outbox messages older than this are deleted by run_maintenance().
+OUTBOX_RETENTION_DAYS = int(os.environ.get("WEBSITE_OUTBOX_RETENTION_DAYS", "30"))
+# How often the web processes run maintenance in the background; 0 disables it.
+MAINTENANCE_INTERVAL_HOURS = float(os.environ.get("WEBSITE_DB_MAINTENANCE_HOURS", "24"))
+
+
+class MaintenanceReport(NamedTuple):
+    expired: int
+    outbox_pruned: int
+    pages_freed: int
+    bytes_freed: int
+    wal_frames_checkpointed: int
+    checkpoint_busy: bool
+    incremental_vacuum: bool
+
+
+def expire_unconfirmed(max_age_days: int = UNCONFIRMED_MAX_AGE_DAYS,
+                       batch_size: int = 500, pause: float = 0.05) -> int:
+    """Delete unconfirmed subscribers older than max_age_days. Returns rows deleted.
+
+    Age counts from the later of sign-up and the last confirmation email,
+    so imported or backdated rows (see import_subscribers) and resends get
+    the full window to confirm. Works in small batches with a short pause
+    in between, so the write lock is never held long enough to stall
+    sign-ups.
+    """
+    cutoff = (datetime.utcnow() - timedelta(days=max_age_days)).isoformat()
+    total = 0
+    while True:
+        with get_db() as conn:
+            deleted = conn.execute(
+                """DELETE FROM subscribers WHERE id IN (
+                       SELECT id FROM subscribers
+                       WHERE confirmed = 0 AND created_at < ?
+                         AND (last_confirmation_sent_at IS NULL OR last_confirmation_sent_at < ?)
+                       LIMIT ?
+                   )""",
+                (cutoff, cutoff, batch_size),
+            ).rowcount
+            conn.commit()
+        total += deleted
+        if deleted < batch_size:
+            return total
+        time.sleep(pause)
+
+
+def enable_incremental_vacuum() -> None:
+    """Switch an existing database to auto_vacuum=INCREMENTAL.
+
+    Needs a full VACUUM, which rewrites the file under an exclusive lock;
+    run it from the CLI during a quiet period.
+    """
+    with get_db() as conn:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+
+
+def run_maintenance(max_age_days: int = UNCONFIRMED_MAX_AGE_DAYS,
+                    batch_size: int = 500, vacuum_pages: int = 1000,
+                    outbox_retention_days: int = OUTBOX_RETENTION_DAYS) -> MaintenanceReport:
+    """Expire stale sign-ups, prune the outbox, return free pages to the OS and checkpoint the WAL."""
+    expired = expire_unconfirmed(max_age_days, batch_size)
+    outbox_pruned = prune_outbox(outbox_retention_days, batch_size)
+    with get_db() as conn:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        incremental = conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        pages_freed = 0
+        if incremental:
+            # Bounded steps, each its own short write transaction.
+            while True:
+                free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                if not free_before:
+                    break
+                conn.execute(f"PRAGMA incremental_vacuum({vacuum_pages})").fetchall()
+                freed = free_before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+                pages_freed += freed
+                if freed <= 0:
+                    break
+        busy, wal_frames, checkpointed = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+        if not busy and wal_frames == checkpointed:
+            # Everything is in the main file: shrink the WAL back to zero bytes.
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return MaintenanceReport(
+        expired=expired,
+        outbox_pruned=outbox_pruned,
+        pages_freed=pages_freed,
+        bytes_freed=pages_freed * page_size,
+        wal_frames_checkpointed=max(checkpointed, 0),
+        checkpoint_busy=bool(busy),
+        incremental_vacuum=incremental,
+    )
+
+
+# --- Group commit ---
+
+class _GroupCommitWriter:
+    """Single writer thread that commits queued signup writes together.
+
+    The first queued write opens a window of WRITE_BATCH_WINDOW_MS; every
+    write that arrives in that window (up to WRITE_BATCH_MAX) goes into
+    the same transaction, so a burst pays for one commit instead of one
+    per signup. Each write runs in its own savepoint, so one failure only
+    fails its own caller.
+    """
+
+    def __init__(self, window: float, max_batch: int):
+        self._window = window
+        self._max_batch = max_batch
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args) -> Future:
+        future: Future = Future()
+        self._queue.put((fn, args, future))
+        return future
+
+    def stop(self) -> None:
+        """Commit everything already queued, then stop the writer thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stopping = False
+            deadline = time.monotonic() + self._window
+            while len(batch) < self._max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+            if stopping:
+                return
+
+    def _commit(self, batch):
+        outcomes = []
+        try:
+            with get_db() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                for fn, args, future in batch:
+                    conn.execute("SAVEPOINT signup")
+                    try:
+                        outcomes.append((future, fn(conn, *args), None))
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO signup")
+                        outcomes.append((future, None, e))
+                    conn.execute("RELEASE signup")
+                conn.commit()
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+_writer: _GroupCommitWriter | None = None
+
+
+def _group_writer() -> _GroupCommitWriter:
+    global _writer
+    if _writer is None:
+        with _pool_lock:
+            if _writer is None:
+                _writer = _GroupCommitWriter(WRITE_BATCH_WINDOW_MS / 1000, WRITE_BATCH_MAX)
+    return _writer
+
+
+def stop_group_writer() -> None:
+    """Flush and stop the group-commit writer, if it was started."""
+    global _writer
+    with _pool_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.stop()
+
+
+# --- Counters ---
+
+def count_subscribers(target: str = "all", confirmed: bool = True) -> int:
+    """Count subscribers matching a newsletter target, from the maintained counters."""
+    with get_db() as conn:
+        if normalize_interests(target) == "all":
+            row = conn.execute(
+                "SELECT COALESCE(SUM(n), 0) FROM subscriber_counts WHERE confirmed = ?",
+                (int(confirmed),),
+            ).fetchone()
+        else:
+            # Counter rows are per interest combination, so this stays a handful of rows.
+            targets = normalize_interests(target).split(",")
+            matches = " OR ".join("instr(',' || interests || ',', ?) > 0" for _ in targets)
+            row = conn.execute(
+                f"""SELECT COALESCE(SUM(n), 0) FROM subscriber_counts
+                    WHERE confirmed = ? AND (interests = 'all' OR {matches})""",
+                (int(confirmed), *(f",{t}," for t in targets)),
+            ).fetchone()
+        return row[0]
+
+
+def count_waitlist(product: str | None = None) -> int:
+    """Count waitlist signups, optionally for a single product."""
+    with get_db() as conn:
+        if product is None:
+            row = conn.execute("SELECT COALESCE(SUM(n), 0) FROM waitlist_counts").fetchone()
+        else:
+            row = conn.execute(
+                "SELECT COALESCE(SUM(n), 0) FROM waitlist_counts WHERE product = ?", (product,)
+            ).fetchone()
+        return row[0]
+
+
+def _counter_snapshot(conn: sqlite3.Connection, table: str) -> dict[tuple, int]:
+    return {tuple(row[:-1]): row[-1] for row in conn.execute(f"SELECT * FROM {table} WHERE n != 0")}
+
+
+def reconcile_counters() -> dict[str, int]:
+    """Rebuild the counter tables from the base tables.
+
+    Returns, per counter table, how many counter rows had drifted.
+    """
+    tables = ("subscriber_counts", "waitlist_counts")
+    with get_db() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            before = {table: _counter_snapshot(conn, table) for table in tables}
+            for statement in _COUNTER_REBUILD:
+                conn.execute(statement)
+            after = {table: _counter_snapshot(conn, table) for table in tables}
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    return {
+        table: sum(
+            1 for key in before[table].keys() | after[table].keys()
+            if before[table].get(key) != after[table].get(key)
+        )
+        for table in tables
+    }
+
+
+def _insert_waitlist(conn: sqlite3.Connection, email: str, name: str, product: str,
+                     language: str, ip_address: str) -> bool:
     try:
         conn.execute(
             "INSERT INTO waitlist (email, name, product, language, ip_address, created_at) VALUES (?, ?, ?, ?, ?, ?)",
             (email.lower().strip(), name.strip(), product, language, ip_address, datetime.utcnow().isoformat()),
         )
-        conn.commit()
         return True
     except sqlite3.IntegrityError:
         return False
-    finally:
-        conn.close()
+
+
+def queue_waitlist_write(email: str, name: str = "", product: str = "both",
+                         language: str = "en", ip_address: str = "") -> Future:
+    """Queue a waitlist insert on the group-commit writer. Resolves like add_to_waitlist."""
+    return _group_writer().submit(_insert_waitlist, email, name, product, language, ip_address)
+
+
+def add_to_waitlist(email: str, name: str = "", product: str = "both",
+                    language: str = "en", ip_address: str = "") -> bool:
+    """Add an email to the waitlist. Returns True if added, False if exists."""
+    if WRITE_BATCHING:
+        return queue_waitlist_write(email, name, product, language, ip_address).result()
+    with get_db() as conn:
+        added = _insert_waitlist(conn, email, name, product, language, ip_address)
+        conn.commit()
+        return added
 
 
 # --- Mailing list ---
 
-def subscribe(email: str, name: str = "", language: str = "en",
-              interests: str = "all", ip_address: str = "") -> tuple[str, str, bool]:
-    """Subscribe to the mailing list.
+INTERESTS = ("all", "perch", "cache", "dash", "announcements")
 
-    Returns (confirm_token, unsubscribe_token, is_new).
-    If already subscribed but unconfirmed, returns existing tokens.
-    If already confirmed, returns ('', unsubscribe_token, False).
+
+def normalize_interests(values: str | Iterable[str]) -> str:
+    """Canonical interests value: known interests, comma-separated in INTERESTS order.
+
+    Accepts a comma-separated string or a list (e.g. checkbox values).
+    Nothing selected, or 'all' selected, means 'all'.
     """
-    email = email.lower().strip()
-    conn = get_db()
-    try:
-        existing = conn.execute(
-            "SELECT confirm_token, unsubscribe_token, confirmed FROM subscribers WHERE email = ?",
-            (email,)
-        ).fetchone()
+    if isinstance(values, str):
+        values = values.split(",")
+    chosen = {value.strip().lower() for value in values}
+    if "all" in chosen:
+        return "all"
+    return ",".join(interest for interest in INTERESTS if interest in chosen) or "all"
 
-        if existing:
-            if existing["confirmed"]:
-                return ("", existing["unsubscribe_token"], False)
-            # Resend: return existing tokens
-            return (existing["confirm_token"], existing["unsubscribe_token"], False)
 
+def _insert_subscriber(conn: sqlite3.Connection, email: str, name: str, language: str,
+                       interests: str | Iterable[str], ip_address: str,
+                       send_confirmation: bool = False) -> tuple[str, str, bool]:
+    email = email.lower().strip()
+    existing = conn.execute(
+        "SELECT confirm_token, unsubscribe_token, confirmed FROM subscribers WHERE email = ?",
+        (email,)
+    ).fetchone()
+
+    if existing:
+        if existing["confirmed"]:
+            return ("", existing["unsubscribe_token"], False)
+        # Resend: reuse existing tokens
+        result = (existing["confirm_token"], existing["unsubscribe_token"], False)
+    else:
         confirm_token = secrets.token_urlsafe(32)
         unsubscribe_token = secrets.token_urlsafe(32)
         conn.execute(
             """INSERT INTO subscribers
                (email, name, language, interests, confirm_token, unsubscribe_token, ip_address, created_at)
                VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-            (email, name.strip(), language, interests, confirm_token, unsubscribe_token,
+            (email, name.strip(), language, normalize_interests(interests), confirm_token, unsubscribe_token,
              ip_address, datetime.utcnow().isoformat()),
         )
+        result = (confirm_token, unsubscribe_token, True)
+    if send_confirmation:
+        _queue_confirmation(conn, email, result[0], language)
+    return result
+
+
+def queue_subscribe_write(email: str, name: str = "", language: str = "en",
+                          interests: str | Iterable[str] = "all", ip_address: str = "",
+                          send_confirmation: bool = False) -> Future:
+    """Queue a subscribe on the group-commit writer. Resolves like subscribe."""
+    return _group_writer().submit(_insert_subscriber, email, name, language, interests, ip_address,
+                                  send_confirmation)
+
+
+def subscribe(email: str, name: str = "", language: str = "en",
+              interests: str | Iterable[str] = "all", ip_address: str = "",
+              send_confirmation: bool = False) -> tuple[str, str, bool]:
+    """Subscribe to the mailing list.
+
+    interests may be a list of INTERESTS or a comma-separated string.
+    Returns (confirm_token, unsubscribe_token, is_new).
+    If already subscribed but unconfirmed, returns existing tokens.
+    If already confirmed, returns ('', unsubscribe_token, False).
+
+    With send_confirmation, a confirmation email for an unconfirmed
+    subscriber is queued in the outbox in the same transaction, unless
+    one went out within the resend cooldown.
+    """
+    if WRITE_BATCHING:
+        return queue_subscribe_write(email, name, language, interests, ip_address, send_confirmation).result()
+    with get_db() as conn:
+        result = _insert_subscriber(conn, email, name, language, interests, ip_address, send_confirmation)
         conn.commit()
-        return (confirm_token, unsubscribe_token, True)
-    finally:
-        conn.close()
+        return result
+
+
+# Repeat sign-ups of an unconfirmed address within this many seconds of the
+# last confirmation email don't send another one; 0 disables the cooldown.
+CONFIRMATION_COOLDOWN_SECONDS = float(os.environ.get("WEBSITE_CONFIRMATION_COOLDOWN_SECONDS", "600"))
+
+
+def _queue_confirmation(conn: sqlite3.Connection, email: str, confirm_token: str, lang: str,
+                        cooldown: float = CONFIRMATION_COOLDOWN_SECONDS) -> int | None:
+    """Queue a confirmation email to an unconfirmed subscriber. Returns the outbox message ID.
+
+    Returns None, and counts a suppressed send, if one went out less than
+    `cooldown` seconds ago. The cooldown check and the update are one
+    statement, so concurrent submissions can't both pass. The caller commits.
+    """
+    now = datetime.utcnow()
+    claimed = conn.execute(
+        """UPDATE subscribers SET last_confirmation_sent_at = ?
+           WHERE email = ? AND confirmed = 0
+             AND (last_confirmation_sent_at IS NULL OR last_confirmation_sent_at <= ?)""",
+        (now.isoformat(), email.lower().strip(), (now - timedelta(seconds=cooldown)).isoformat()),
+    ).rowcount
+    if not claimed:
+        conn.execute(
+            """INSERT INTO mail_counters (name, n) VALUES ('confirmation_suppressed', 1)
+               ON CONFLICT (name) DO UPDATE SET n = n + 1"""
+        )
+        return None
+    return _enqueue_mail(conn, "confirmation", email, {"confirm_token": confirm_token, "lang": lang})
+
+
+def count_suppressed_confirmations() -> int:
+    """Confirmation emails skipped because of the resend cooldown, all time."""
+    with get_db() as conn:
+        row = conn.execute("SELECT n FROM mail_counters WHERE name = 'confirmation_suppressed'").fetchone()
+        return row["n"] if row else 0
 
 
 def confirm_subscriber(token: str) -> bool:
     """Confirm a subscriber by token. Returns True if confirmed."""
-    conn = get_db()
-    try:
+    with get_db() as conn:
         row = conn.execute(
             "SELECT id, confirmed FROM subscribers WHERE confirm_token = ?", (token,)
         ).fetchone()
@@ -137,131 +865,557 @@ def confirm_subscriber(token: str) -> bool:
         )
         conn.commit()
         return True
-    finally:
-        conn.close()
 
 
 def unsubscribe(token: str) -> bool:
     """Unsubscribe by token. Returns True if found and removed."""
-    conn = get_db()
-    try:
+    with get_db() as conn:
         result = conn.execute(
             "DELETE FROM subscribers WHERE unsubscribe_token = ?", (token,)
         )
         conn.commit()
         return result.rowcount > 0
-    finally:
-        conn.close()
+
+
+# --- Bulk import / export ---
+
+# Columns written by export and understood by import, per table.
+EXPORT_COLUMNS = {
+    "waitlist": ("email", "name", "product", "language", "created_at"),
+    "subscribers": ("email", "name", "language", "interests", "confirmed", "created_at", "confirmed_at"),
+}
+EXPORT_PAGE_SIZE = 1000
+
+
+class ImportResult(NamedTuple):
+    read: int
+    inserted: int
+    duplicates: int
+    invalid: int
+    confirmations_queued: int = 0
+
+
+def _import_flag(value: str | None, default: bool) -> bool:
+    """A boolean CSV cell ("1"/"0", "true"/"false", "yes"/"no"); blank or missing means `default`."""
+    value = (value or "").strip().lower()
+    if not value:
+        return default
+    return value not in ("0", "false", "no")
+
+
+def _bulk_tokens(count: int) -> list[str]:
+    """Generate `count` tokens in the secrets.token_urlsafe(32) format from one urandom read."""
+    raw = secrets.token_bytes(32 * count)
+    return [
+        base64.urlsafe_b64encode(raw[i:i + 32]).rstrip(b"=").decode("ascii")
+        for i in range(0, len(raw), 32)
+    ]
+
+
+def import_subscribers(rows: Iterable[dict], confirmed: bool = False,
+                       chunk_size: int = 1000, progress=None) -> ImportResult:
+    """Bulk-insert subscribers from dicts (e.g. csv.DictReader over an export).
+
+    Rows are consumed lazily and inserted with executemany, one transaction
+    per chunk. Emails already in the table, or earlier in the input, are
+    skipped. A row's confirmed / confirmed_at columns (as written by the
+    export) are kept; `confirmed` is only the default for rows without
+    them. confirmed=True imports those as already opted in (only do this
+    for lists that were confirmed elsewhere).
+
+    Unconfirmed rows get a confirm token like a regular signup, and a
+    confirmation email is queued in the outbox for each inserted one;
+    the expiry window (expire_unconfirmed) starts at that send.
+    progress, if given, is called with the running ImportResult after
+    every chunk.
+    """
+    read = inserted = invalid = queued = 0
+    now = datetime.utcnow().isoformat()
+    chunk: list[tuple] = []
+
+    def flush(conn):
+        nonlocal inserted, queued, chunk
+        tokens = _bulk_tokens(2 * len(chunk))
+        params = [
+            (*row, now if not row[4] else None, None if row[4] else tokens[2 * i], tokens[2 * i + 1])
+            for i, row in enumerate(chunk)
+        ]
+        cursor = conn.executemany(
+            """INSERT OR IGNORE INTO subscribers
+               (email, name, language, interests, confirmed, created_at, confirmed_at,
+                last_confirmation_sent_at, ip_address, confirm_token, unsubscribe_token)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL, ?, ?)""",
+            params,
+        )
+        inserted += cursor.rowcount
+        # Confirm tokens are fresh, so the rows that have one were inserted just now.
+        pending = conn.execute(
+            """SELECT email, language, confirm_token FROM subscribers
+               WHERE confirm_token IN (SELECT value FROM json_each(?))""",
+            (json.dumps([p[-2] for p in params if p[-2] is not None]),),
+        ).fetchall()
+        conn.executemany(
+            """INSERT INTO outbox (kind, recipient, payload, next_attempt_at, created_at)
+               VALUES ('confirmation', ?, ?, ?, ?)""",
+            [
+                (row["email"], json.dumps({"confirm_token": row["confirm_token"], "lang": row["language"]}),
+                 now, now)
+                for row in pending
+            ],
+        )
+        conn.commit()
+        queued += len(pending)
+        chunk = []
+        if progress:
+            progress(ImportResult(read, inserted, read - invalid - inserted, invalid, queued))
+
+    with get_db() as conn:
+        for row in rows:
+            read += 1
+            email = (row.get("email") or "").lower().strip()
+            if "@" not in email or not email.rpartition("@")[0].isascii():
+                # A non-ASCII local part can't be mailed without SMTPUTF8 (mail.ascii_address).
+                invalid += 1
+                continue
+            language = row.get("language") if row.get("language") in ("en", "nl") else "en"
+            interests = normalize_interests(row.get("interests") or "all")
+            row_confirmed = _import_flag(row.get("confirmed"), confirmed)
+            chunk.append((
+                email, (row.get("name") or "").strip(), language, interests,
+                int(row_confirmed), row.get("created_at") or now,
+                (row.get("confirmed_at") or now) if row_confirmed else None,
+            ))
+            if len(chunk) >= chunk_size:
+                flush(conn)
+        if chunk:
+            flush(conn)
+    return ImportResult(read, inserted, read - invalid - inserted, invalid, queued)
+
+
+def get_export_page(table: str, after_id: int = 0, limit: int = EXPORT_PAGE_SIZE) -> list[tuple]:
+    """Get one keyset page of export rows as (id, *EXPORT_COLUMNS[table]) tuples."""
+    columns = ", ".join(EXPORT_COLUMNS[table])
+    with get_db() as conn:
+        cursor = conn.execute(
+            f"SELECT id, {columns} FROM {table} WHERE id > ? ORDER BY id LIMIT ?",
+            (after_id, limit),
+        )
+        cursor.row_factory = None
+        return cursor.fetchall()
+
+
+def iter_export_pages(table: str, page_size: int = EXPORT_PAGE_SIZE) -> Iterator[list[tuple]]:
+    """Yield an exportable table in pages of rows (without id)."""
+    after_id = 0
+    while True:
+        page = get_export_page(table, after_id, page_size)
+        yield [row[1:] for row in page]
+        if len(page) < page_size:
+            return
+        after_id = page[-1][0]
+
+
+def iter_export_rows(table: str, page_size: int = EXPORT_PAGE_SIZE) -> Iterator[tuple]:
+    """Yield every row of an exportable table (without id), one page in memory at a time."""
+    for page in iter_export_pages(table, page_size):
+        yield from page
+
+
+# --- Outbox ---
+
+class OutboxMessage(NamedTuple):
+    id: int
+    kind: str
+    recipient: str
+    payload: dict
+    attempts: int
+
+
+def _enqueue_mail(conn: sqlite3.Connection, kind: str, recipient: str, payload: dict) -> int:
+    """Store a message in the outbox for the delivery worker. Returns its ID; the caller commits."""
+    now = datetime.utcnow().isoformat()
+    return conn.execute(
+        """INSERT INTO outbox (kind, recipient, payload, next_attempt_at, created_at)
+           VALUES (?, ?, ?, ?, ?)""",
+        (kind, recipient, json.dumps(payload), now, now),
+    ).lastrowid
+
+
+def claim_outbox(limit: int, lease_seconds: float) -> list[OutboxMessage]:
+    """Claim up to `limit` due messages and count the attempt.
+
+    A claim pushes next_attempt_at out by the lease, so a worker that dies
+    mid-batch doesn't lose its messages: they become due again afterwards.
+    """
+    now = datetime.utcnow()
+    with get_db() as conn:
+        rows = conn.execute(
+            """UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ?
+               WHERE id IN (
+                   SELECT id FROM outbox WHERE status = 'pending' AND next_attempt_at <= ?
+                   ORDER BY next_attempt_at LIMIT ?
+               )
+               RETURNING id, kind, recipient, payload, attempts""",
+            ((now + timedelta(seconds=lease_seconds)).isoformat(), now.isoformat(), limit),
+        ).fetchall()
+        conn.commit()
+    messages = [OutboxMessage(r["id"], r["kind"], r["recipient"], json.loads(r["payload"]), r["attempts"])
+                for r in rows]
+    return sorted(messages, key=lambda m: m.id)
+
+
+def mark_outbox_sent(message_id: int) -> None:
+    """Mark a delivered message as sent."""
+    with get_db() as conn:
+        conn.execute(
+            "UPDATE outbox SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?",
+            (datetime.utcnow().isoformat(), message_id),
+        )
+        conn.commit()
+
+
+def mark_outbox_failed(message_id: int, error: str, retry_at: datetime | None) -> None:
+    """Record a failed attempt: retry at retry_at, or give up when it is None."""
+    with get_db() as conn:
+        if retry_at is None:
+            conn.execute(
+                "UPDATE outbox SET status = 'failed', last_error = ? WHERE id = ?",
+                (error, message_id),
+            )
+        else:
+            conn.execute(
+                "UPDATE outbox SET next_attempt_at = ?, last_error = ? WHERE id = ?",
+                (retry_at.isoformat(), error, message_id),
+            )
+        conn.commit()
+
+
+def prune_outbox(max_age_days: int = OUTBOX_RETENTION_DAYS,
+                 batch_size: int = 500, pause: float = 0.05) -> int:
+    """Delete sent and failed outbox messages older than max_age_days. Returns rows deleted.
+
+    Pending messages are never pruned. Batched like expire_unconfirmed.
+    """
+    cutoff = (datetime.utcnow() - timedelta(days=max_age_days)).isoformat()
+    total = 0
+    while True:
+        with get_db() as conn:
+            deleted = conn.execute(
+                """DELETE FROM outbox WHERE id IN (
+                       SELECT id FROM outbox WHERE status != 'pending' AND created_at < ? LIMIT ?
+                   )""",
+                (cutoff, batch_size),
+            ).rowcount
+            conn.commit()
+        total += deleted
+        if deleted < batch_size:
+            return total
+        time.sleep(pause)
+
+
+def outbox_stats() -> dict[str, int]:
+    """Count outbox messages per status."""
+    with get_db() as conn:
+        rows = conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
 
 
 # --- Newsletters ---
 
+def _compiled_columns(body_en: str, body_nl: str, body_format: str) -> tuple[str, str, str, str]:
+    """(html_en, html_nl, text_en, text_nl) for the stored body sources."""
+    en = compose.compile_body(body_en, body_format)
+    nl = compose.compile_body(body_nl, body_format)
+    return en.html, nl.html, en.text, nl.text
+
+
+def _compile_newsletters(conn: sqlite3.Connection) -> None:
+    """Compile newsletters saved before bodies were compiled on save."""
+    rows = conn.execute("SELECT id, body_en, body_nl, body_format FROM newsletters WHERE html_en IS NULL").fetchall()
+    for row in rows:
+        conn.execute(
+            "UPDATE newsletters SET html_en = ?, html_nl = ?, text_en = ?, text_nl = ? WHERE id = ?",
+            (*_compiled_columns(row["body_en"], row["body_nl"], row["body_format"]), row["id"]),
+        )
+    conn.commit()
+
+
 def create_newsletter(subject_en: str, subject_nl: str, body_en: str, body_nl: str,
-                      target: str = "all") -> int:
-    """Create a draft newsletter. Returns the newsletter ID."""
-    conn = get_db()
-    try:
+                      target: str = "all", body_format: str = "markdown") -> int:
+    """Create a draft newsletter, compiling its bodies. Returns the newsletter ID."""
+    compiled = _compiled_columns(body_en, body_nl, body_format)
+    with get_db() as conn:
         cursor = conn.execute(
-            """INSERT INTO newsletters (subject_en, subject_nl, body_en, body_nl, target, status, created_at)
-               VALUES (?, ?, ?, ?, ?, 'draft', ?)""",
-            (subject_en, subject_nl, body_en, body_nl, target, datetime.utcnow().isoformat()),
+            """INSERT INTO newsletters (subject_en, subject_nl, body_en, body_nl, body_format,
+                                        html_en, html_nl, text_en, text_nl, target, status, created_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'draft', ?)""",
+            (subject_en, subject_nl, body_en, body_nl, body_format, *compiled, target,
+             datetime.utcnow().isoformat()),
         )
         conn.commit()
         return cursor.lastrowid
-    finally:
-        conn.close()
 
 
 def update_newsletter(newsletter_id: int, subject_en: str, subject_nl: str,
-                      body_en: str, body_nl: str, target: str = "all") -> bool:
-    """Update a draft newsletter."""
-    conn = get_db()
-    try:
+                      body_en: str, body_nl: str, target: str = "all", body_format: str = "markdown") -> bool:
+    """Update a draft newsletter, recompiling its bodies."""
+    compiled = _compiled_columns(body_en, body_nl, body_format)
+    with get_db() as conn:
         result = conn.execute(
-            """UPDATE newsletters SET subject_en = ?, subject_nl = ?, body_en = ?, body_nl = ?, target = ?
+            """UPDATE newsletters SET subject_en = ?, subject_nl = ?, body_en = ?, body_nl = ?, body_format = ?,
+                                      html_en = ?, html_nl = ?, text_en = ?, text_nl = ?, target = ?
                WHERE id = ? AND status = 'draft'""",
-            (subject_en, subject_nl, body_en, body_nl, target, newsletter_id),
+            (subject_en, subject_nl, body_en, body_nl, body_format, *compiled, target, newsletter_id),
         )
         conn.commit()
         return result.rowcount > 0
-    finally:
-        conn.close()
 
 
 def get_newsletter(newsletter_id: int) -> dict | None:
     """Get a single newsletter by ID."""
-    conn = get_db()
-    try:
+    with get_db() as conn:
         row = conn.execute("SELECT * FROM newsletters WHERE id = ?", (newsletter_id,)).fetchone()
         return dict(row) if row else None
-    finally:
-        conn.close()
 
 
 def list_newsletters() -> list[dict]:
     """List all newsletters, newest first."""
-    conn = get_db()
-    try:
+    with get_db() as conn:
         rows = conn.execute("SELECT * FROM newsletters ORDER BY created_at DESC").fetchall()
         return [dict(r) for r in rows]
-    finally:
-        conn.close()
 
 
 def schedule_newsletter(newsletter_id: int) -> bool:
     """Mark a draft newsletter as ready to send."""
-    conn = get_db()
-    try:
+    with get_db() as conn:
         result = conn.execute(
             "UPDATE newsletters SET status = 'scheduled', scheduled_at = ? WHERE id = ? AND status = 'draft'",
             (datetime.utcnow().isoformat(), newsletter_id),
         )
         conn.commit()
         return result.rowcount > 0
-    finally:
-        conn.close()
 
 
-def mark_newsletter_sent(newsletter_id: int, count: int) -> None:
-    """Mark a newsletter as sent with the number of recipients."""
-    conn = get_db()
-    try:
-        conn.execute(
-            "UPDATE newsletters SET status = 'sent', sent_at = ?, sent_count = ? WHERE id = ?",
-            (datetime.utcnow().isoformat(), count, newsletter_id),
+_MARK_SENT = """UPDATE newsletters SET status = 'sent', sent_at = ?,
+    sent_count = (SELECT COUNT(*) FROM newsletter_deliveries WHERE newsletter_id = newsletters.id)
+    WHERE id = ?"""
+
+
+def mark_newsletter_sent(newsletter_id: int) -> None:
+    """Mark a newsletter as sent; sent_count comes from its delivery log."""
+    with get_db() as conn:
+        conn.execute(_MARK_SENT, (datetime.utcnow().isoformat(), newsletter_id))
+        conn.commit()
+
+
+def record_deliveries(newsletter_id: int, subscriber_ids: list[int]) -> None:
+    """Log a batch of successful deliveries in one transaction. Already logged ones are ignored."""
+    if not subscriber_ids:
+        return
+    now = datetime.utcnow().isoformat()
+    with get_db() as conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO newsletter_deliveries (newsletter_id, subscriber_id, delivered_at) VALUES (?, ?, ?)",
+            [(newsletter_id, subscriber_id, now) for subscriber_id in subscriber_ids],
         )
         conn.commit()
-    finally:
-        conn.close()
 
 
-def get_confirmed_subscribers(target: str = "all") -> list[dict]:
-    """Get all confirmed subscribers, optionally filtered by interest."""
-    conn = get_db()
-    try:
-        if target == "all":
-            rows = conn.execute(
-                "SELECT * FROM subscribers WHERE confirmed = 1"
-            ).fetchall()
+def count_deliveries(newsletter_id: int) -> int:
+    """Number of subscribers a newsletter has been delivered to so far."""
+    with get_db() as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM newsletter_deliveries WHERE newsletter_id = ?", (newsletter_id,),
+        ).fetchone()[0]
+
+
+# Send jobs: one row per attempt to send a newsletter. While a job runs the
+# newsletter is 'sending'; a job that doesn't complete, or completes with
+# failed recipients, puts it back to 'scheduled' so the rest can be resent.
+SEND_JOB_STATUSES = ("running", "completed", "cancelled", "failed", "interrupted")
+
+
+def start_send_job(newsletter_id: int, total: int) -> int | None:
+    """Move a newsletter to 'sending' and create its job. None if it isn't sendable."""
+    now = datetime.utcnow().isoformat()
+    with get_db() as conn:
+        claimed = conn.execute(
+            "UPDATE newsletters SET status = 'sending' WHERE id = ? AND status IN ('draft', 'scheduled')",
+            (newsletter_id,),
+        ).rowcount
+        if not claimed:
+            return None
+        cursor = conn.execute(
+            """INSERT INTO send_jobs (newsletter_id, total, created_at, updated_at)
+               VALUES (?, ?, ?, ?)""",
+            (newsletter_id, total, now, now),
+        )
+        conn.commit()
+        return cursor.lastrowid
+
+
+def update_send_job(job_id: int, sent: int, failed: int) -> bool:
+    """Record a running job's progress. Returns True if cancellation was requested.
+
+    A job whose row is gone counts as cancelled: nothing could track or stop it.
+    """
+    with get_db() as conn:
+        row = conn.execute(
+            "UPDATE send_jobs SET sent = ?, failed = ?, updated_at = ? WHERE id = ? RETURNING cancel_requested",
+            (sent, failed, datetime.utcnow().isoformat(), job_id),
+        ).fetchone()
+        conn.commit()
+        return row is None or bool(row["cancel_requested"])
+
+
+_RELEASE_SENDING = "UPDATE newsletters SET status = 'scheduled' WHERE id = ? AND status = 'sending'"
+
+
+def finish_send_job(job_id: int, status: str, sent: int, failed: int, error: str | None = None) -> bool:
+    """Close a job. Only a job that completed with no failures marks its newsletter sent.
+
+    Otherwise the newsletter goes back to 'scheduled', and resuming it
+    retries the recipients that weren't delivered. Returns False, changing nothing, if there is no such job.
+    """
+    now = datetime.utcnow().isoformat()
+    with get_db() as conn:
+        row = conn.execute(
+            """UPDATE send_jobs SET status = ?, sent = ?, failed = ?, error = ?, updated_at = ?, finished_at = ?
+               WHERE id = ? RETURNING newsletter_id""",
+            (status, sent, failed, error, now, now, job_id),
+        ).fetchone()
+        if row is None:
+            print(f"[db] Send job {job_id} not found, can't mark it {status}")
+            return False
+        if status == "completed" and not failed:
+            conn.execute(_MARK_SENT, (now, row["newsletter_id"]))
         else:
-            rows = conn.execute(
-                "SELECT * FROM subscribers WHERE confirmed = 1 AND (interests = ? OR interests = 'all')",
-                (target,)
-            ).fetchall()
-        return [dict(r) for r in rows]
-    finally:
-        conn.close()
+            conn.execute(_RELEASE_SENDING, (row["newsletter_id"],))
+        conn.commit()
+        return True
+
+
+def release_newsletter(newsletter_id: int) -> None:
+    """Put a newsletter left 'sending' without a job back to 'scheduled', so it can be resumed."""
+    with get_db() as conn:
+        conn.execute(_RELEASE_SENDING, (newsletter_id,))
+        conn.commit()
+
+
+def cancel_send_job(newsletter_id: int) -> bool:
+    """Ask the running job for a newsletter to stop. Returns True if one was running."""
+    with get_db() as conn:
+        result = conn.execute(
+            "UPDATE send_jobs SET cancel_requested = 1 WHERE newsletter_id = ? AND status = 'running'",
+            (newsletter_id,),
+        )
+        conn.commit()
+        return result.rowcount > 0
+
+
+def get_send_job(newsletter_id: int) -> dict | None:
+    """The most recent send job for a newsletter, with a `remaining` count."""
+    with get_db() as conn:
+        row = conn.execute(
+            "SELECT * FROM send_jobs WHERE newsletter_id = ? ORDER BY id DESC LIMIT 1",
+            (newsletter_id,),
+        ).fetchone()
+    if not row:
+        return None
+    job = dict(row)
+    job["remaining"] = max(0, job["total"] - job["sent"] - job["failed"])
+    return job
+
+
+def interrupt_send_jobs() -> int:
+    """Close jobs left running by a previous process. Call once at startup."""
+    now = datetime.utcnow().isoformat()
+    with get_db() as conn:
+        result = conn.execute(
+            "UPDATE send_jobs SET status = 'interrupted', updated_at = ?, finished_at = ? WHERE status = 'running'",
+            (now, now),
+        )
+        conn.execute("UPDATE newsletters SET status = 'scheduled' WHERE status = 'sending'")
+        conn.commit()
+        return result.rowcount
+
+
+class Recipient(NamedTuple):
+    """The per-recipient fields a send needs (id is the pagination cursor)."""
+    id: int
+    email: str
+    language: str
+    unsubscribe_token: str
+
+
+RECIPIENT_PAGE_SIZE = 500
+
+
+def get_recipient_page(target: str = "all", after_id: int = 0,
+                       limit: int = RECIPIENT_PAGE_SIZE, exclude_delivered: int | None = None) -> list[Recipient]:
+    """Get one keyset page of confirmed recipients with id > after_id, in id order.
+
+    With exclude_delivered set to a newsletter ID, subscribers already in
+    that newsletter's delivery log are left out.
+    """
+    targets = normalize_interests(target)
+    undelivered, undelivered_params = "", ()
+    if exclude_delivered is not None:
+        undelivered = """ AND NOT EXISTS (SELECT 1 FROM newsletter_deliveries d
+                          WHERE d.newsletter_id = ? AND d.subscriber_id = s.id)"""
+        undelivered_params = (exclude_delivered,)
+    with get_db() as conn:
+        if targets == "all":
+            cursor = conn.execute(
+                """SELECT id, email, language, unsubscribe_token FROM subscribers s
+                   WHERE confirmed = 1 AND id > ?""" + undelivered + " ORDER BY id LIMIT ?",
+                (after_id, *undelivered_params, limit),
+            )
+        else:
+            # One ordered junction range scan per interest (plus 'all'), merged
+            # by subscriber id, rather than sorting every match. UNION drops
+            # subscribers that match more than one of the interests.
+            targets = targets.split(",") + ["all"]
+            arm = """SELECT i.subscriber_id, s.email, s.language, s.unsubscribe_token
+                     FROM subscriber_interests i JOIN subscribers s ON s.id = i.subscriber_id
+                     WHERE i.interest = ? AND i.subscriber_id > ? AND s.confirmed = 1""" + undelivered
+            cursor = conn.execute(
+                "\nUNION\n".join(arm for _ in targets) + "\nORDER BY 1 LIMIT ?",
+                (*(p for t in targets for p in (t, after_id, *undelivered_params)), limit),
+            )
+        cursor.row_factory = lambda _cursor, row: Recipient(*row)
+        return cursor.fetchall()
+
+
+def iter_recipient_pages(target: str = "all", page_size: int = RECIPIENT_PAGE_SIZE,
+                         exclude_delivered: int | None = None) -> Iterator[list[Recipient]]:
+    """Yield confirmed recipients for a target in keyset pages (see get_recipient_page)."""
+    after_id = 0
+    while True:
+        page = get_recipient_page(target, after_id, page_size, exclude_delivered)
+        yield page
+        if len(page) < page_size:
+            return
+        after_id = page[-1].id
+
+
+def iter_confirmed_recipients(target: str = "all", page_size: int = RECIPIENT_PAGE_SIZE,
+                              exclude_delivered: int | None = None) -> Iterator[Recipient]:
+    """Yield confirmed recipients for a target, one page in memory at a time.
+
+    Each page uses its own short read, so a long send never pins a
+    connection or holds back WAL checkpoints.
+    """
+    for page in iter_recipient_pages(target, page_size, exclude_delivered):
+        yield from page
 
 
 def delete_newsletter(newsletter_id: int) -> bool:
     """Delete a draft newsletter."""
-    conn = get_db()
-    try:
+    with get_db() as conn:
         result = conn.execute(
             "DELETE FROM newsletters WHERE id = ? AND status = 'draft'",
             (newsletter_id,),
         )
         conn.commit()
         return result.rowcount > 0
-    finally:
-        conn.close()
@@ -0,0 +1,246 @@
+"""Concurrent, rate-limited newsletter delivery.
+
+A fixed set of worker threads pull recipients from a shared keyset-paged
+iterator and send through the SMTP pool, so the total send time is roughly
+recipients x SMTP latency / NEWSLETTER_CONCURRENCY instead of the serial
+sum. Every send first takes a slot from each configured rate limit, which
+keeps a run under the mail provider's per-second and per-hour quotas.
+
+The admin sends run as background jobs (start_send_job) that record their
+progress in the send_jobs table and stop when cancellation is requested.
+
+Concurrency above SMTP_MAX_SESSIONS only adds threads waiting for a
+session, so raise both together.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import Counter, deque
+from collections.abc import Iterable
+from typing import NamedTuple
+
+import database
+import mail
+
+NEWSLETTER_CONCURRENCY = int(os.environ.get("NEWSLETTER_CONCURRENCY", str(mail.SMTP_MAX_SESSIONS)))
+# Provider quotas; 0 means unlimited.
+NEWSLETTER_RATE_PER_SECOND = float(os.environ.get("NEWSLETTER_RATE_PER_SECOND", "0"))
+NEWSLETTER_RATE_PER_HOUR = int(os.environ.get("NEWSLETTER_RATE_PER_HOUR", "0"))
+
+
+class RateLimiter:
+    """Sliding-window limit of `limit` acquisitions per `period` seconds, shared by threads."""
+
+    def __init__(self, limit: int, period: float):
+        self.limit = limit
+        self.period = period
+        self._times: deque[float] = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self, stop: threading.Event | None = None) -> bool:
+        """Block until a slot is free in the current window and take it. False if stopped first."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._times and now - self._times[0] >= self.period:
+                    self._times.popleft()
+                if len(self._times) < self.limit:
+                    self._times.append(now)
+                    return True
+                wait = self.period - (now - self._times[0])
+            if stop is None:
+                time.sleep(wait)
+            elif stop.wait(wait):
+                return False
+
+
+def rate_limiters(per_second: float = NEWSLETTER_RATE_PER_SECOND,
+                  per_hour: int = NEWSLETTER_RATE_PER_HOUR) -> list[RateLimiter]:
+    """Limiters for the configured quotas. Fractional per-second rates are spread over a longer window."""
+    limiters = []
+    if per_second >= 1:
+        # A whole count per window: 2.5/s is 5 per 2 s. Rates that would need a
+        # window over 10 s are rounded down, so the quota is never exceeded.
+        window = next((w for w in range(1, 11) if abs(per_second * w - round(per_second * w)) < 1e-9), None)
+        if window is None:
+            window, count = 10, math.floor(per_second * 10)
+        else:
+            count = round(per_second * window)
+        limiters.append(RateLimiter(count, float(window)))
+    elif per_second > 0:
+        limiters.append(RateLimiter(1, 1 / per_second))
+    if per_hour > 0:
+        limiters.append(RateLimiter(per_hour, 3600.0))
+    return limiters
+
+
+class DispatchReport(NamedTuple):
+    sent: int
+    failed: int
+    elapsed: float
+    errors: dict[str, int]  # exception type -> count
+    stopped: bool = False
+
+    @property
+    def attempted(self) -> int:
+        return self.sent + self.failed
+
+    @property
+    def throughput(self) -> float:
+        """Messages sent per second."""
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def error_rate(self) -> float:
+        return self.failed / self.attempted if self.attempted else 0.0
+
+    def summary(self) -> str:
+        errors = ", ".join(f"{name} x{n}" for name, n in sorted(self.errors.items()))
+        return (f"sent {self.sent}, failed {self.failed} ({self.error_rate:.1%}) "
+                f"in {self.elapsed:.1f}s, {self.throughput:.1f} msg/s"
+                + (f"; errors: {errors}" if errors else ""))
+
+
+def dispatch(send, recipients: Iterable, concurrency: int = NEWSLETTER_CONCURRENCY,
+             limiters: list[RateLimiter] | None = None, stop: threading.Event | None = None,
+             progress=None, progress_interval: float = 1.0) -> DispatchReport:
+    """Call send(recipient) for every recipient on `concurrency` threads.
+
+    send raises on failure. Failures are counted per exception type and
+    don't stop the run; an error reading recipients does, and is raised.
+    Setting `stop` ends the run after the sends in flight;
+    progress(sent, failed) is called from this thread every
+    progress_interval seconds while sending.
+    """
+    limiters = rate_limiters() if limiters is None else limiters
+    stop = stop or threading.Event()
+    recipients = iter(recipients)
+    next_lock = threading.Lock()
+    stats_lock = threading.Lock()
+    sent = 0
+    errors: Counter[str] = Counter()
+    aborted: list[Exception] = []
+
+    def work():
+        nonlocal sent
+        while not stop.is_set():
+            with next_lock:
+                try:
+                    recipient = next(recipients, None)
+                except Exception as e:
+                    # Reading recipients failed (not a send): abort the whole run.
+                    aborted.append(e)
+                    stop.set()
+                    return
+            if recipient is None:
+                return
+            if not all(limiter.acquire(stop) for limiter in limiters):
+                return
+            try:
+                send(recipient)
+            except Exception as e:
+                with stats_lock:
+                    errors[type(e).__name__] += 1
+            else:
+                with stats_lock:
+                    sent += 1
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=work, name=f"dispatch-{i}") for i in range(max(1, concurrency))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(progress_interval)
+            if progress is not None:
+                with stats_lock:
+                    counts = sent, sum(errors.values())
+                progress(*counts)
+    if aborted:
+        raise aborted[0]
+    return DispatchReport(sent, sum(errors.values()), time.monotonic() - start, dict(errors), stop.is_set())
+
+
+def send_newsletter(newsletter: dict, concurrency: int = NEWSLETTER_CONCURRENCY,
+                    limiters: list[RateLimiter] | None = None, stop: threading.Event | None = None,
+                    progress=None) -> DispatchReport:
+    """Send a newsletter to every confirmed subscriber in its target and log the report.
+
+    Subscribers already in the newsletter's delivery log are skipped, so
+    running this again after an interruption resumes the send. Successful
+    deliveries are logged in batches at each progress tick; a crash can
+    lose at most the last tick's worth, which are then sent again.
+    """
+    messages = {
+        lang: mail.NewsletterMessage(newsletter[f"subject_{lang}"], newsletter[f"html_{lang}"], lang,
+                                     newsletter[f"text_{lang}"])
+        for lang in ("en", "nl")
+    }
+    delivered: list[int] = []
+    delivered_lock = threading.Lock()
+
+    def send(recipient: database.Recipient):
+        message = messages["nl" if recipient.language == "nl" else "en"]
+        mail.deliver_newsletter(recipient.email, message, recipient.unsubscribe_token)
+        with delivered_lock:
+            delivered.append(recipient.id)
+
+    def flush():
+        with delivered_lock:
+            batch = delivered[:]
+            delivered.clear()
+        database.record_deliveries(newsletter["id"], batch)
+
+    def on_progress(sent: int, failed: int):
+        flush()
+        if progress is not None:
+            progress(sent, failed)
+
+    recipients = database.iter_confirmed_recipients(newsletter["target"], exclude_delivered=newsletter["id"])
+    try:
+        report = dispatch(send, recipients, concurrency, limiters, stop=stop, progress=on_progress)
+    finally:
+        flush()
+    print(f"[mail] Newsletter {newsletter['id']}: {report.summary()}"
+          + (" (cancelled)" if report.stopped else ""))
+    return report
+
+
+def _run_job(job_id: int, newsletter: dict) -> None:
+    stop = threading.Event()
+
+    def progress(sent: int, failed: int):
+        if database.update_send_job(job_id, sent, failed):
+            stop.set()
+
+    try:
+        report = send_newsletter(newsletter, stop=stop, progress=progress)
+    except Exception as e:
+        print(f"[mail] Newsletter {newsletter['id']}: send job {job_id} failed: {e}")
+        job = database.get_send_job(newsletter["id"])
+        sent, failed = (job["sent"], job["failed"]) if job and job["id"] == job_id else (0, 0)
+        status, error = "failed", str(e)
+    else:
+        status = "cancelled" if report.stopped else "completed"
+        sent, failed, error = report.sent, report.failed, None
+    if not database.finish_send_job(job_id, status, sent, failed, error):
+        # The job row is gone (deleted by hand): don't leave the newsletter stuck in 'sending'.
+        database.release_newsletter(newsletter["id"])
+
+
+def start_send_job(newsletter: dict) -> int | None:
+    """Start sending a newsletter on a background thread.
+
+    Returns the job ID, or None if the newsletter isn't sendable (already
+    sent or being sent). A newsletter whose earlier job was cancelled or
+    interrupted picks up with the recipients it hasn't reached yet. Progress and cancellation go through the
+    send_jobs row, see database.update_send_job and cancel_send_job.
+    """
+    total = max(0, database.count_subscribers(newsletter["target"]) - database.count_deliveries(newsletter["id"]))
+    job_id = database.start_send_job(newsletter["id"], total)
+    if job_id is not None:
+        threading.Thread(target=_run_job, args=(job_id, newsletter), name=f"send-job-{job_id}",
+                         daemon=True).start()
+    return job_id
@@ -1,47 +1,198 @@
 """Email sending for Siskin Labs (confirmation loop + notifications)."""
 
 import os
+import secrets
 import smtplib
+import threading
+import time
+from email import quoprimime
+from email.header import Header
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from email.utils import formataddr
 
 SMTP_HOST = os.environ.get("SMTP_HOST", "")
 SMTP_PORT = int(os.environ.get("SMTP_PORT", "587"))
 SMTP_USER = os.environ.get("SMTP_USER", "")
 SMTP_PASS = os.environ.get("SMTP_PASS", "")
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "1").lower() not in ("0", "false", "no")
+# Session pool: concurrent connections, idle lifetime and messages per connection
+# (most providers cap the latter, so sessions are recycled before hitting it).
+SMTP_MAX_SESSIONS = int(os.environ.get("SMTP_MAX_SESSIONS", "2"))
+SMTP_IDLE_TIMEOUT = float(os.environ.get("SMTP_IDLE_TIMEOUT", "60"))
+SMTP_MESSAGES_PER_SESSION = int(os.environ.get("SMTP_MESSAGES_PER_SESSION", "100"))
 FROM_EMAIL = os.environ.get("FROM_EMAIL", "hello@siskin.amsterdam")
 FROM_NAME = os.environ.get("FROM_NAME", "Siskin Labs")
 BASE_URL = os.environ.get("BASE_URL", "https://siskin.amsterdam")
 
 
-def _send(to: str, subject: str, html: str, text: str = ""):
-    """Send an email via SMTP."""
+class _Session:
+    def __init__(self, server: smtplib.SMTP):
+        self.server = server
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+    def close(self):
+        try:
+            self.server.quit()
+        except (smtplib.SMTPException, OSError):
+            self.server.close()
+
+
+class SMTPPool:
+    """Authenticated SMTP sessions that are kept open and reused across messages.
+
+    At most max_sessions connections exist at once; further senders wait
+    for a free one. Sessions idle for longer than idle_timeout, or that
+    have sent messages_per_session messages, are closed and replaced. A
+    pooled session that turns out to be dead is replaced and the message
+    retried once on a fresh connection.
+    """
+
+    def __init__(self, host: str, port: int, user: str = "", password: str = "",
+                 starttls: bool = True, max_sessions: int = 2, idle_timeout: float = 60,
+                 messages_per_session: int = 100):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.idle_timeout = idle_timeout
+        self.messages_per_session = messages_per_session
+        self._idle: list[_Session] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_sessions)
+
+    def _connect(self) -> _Session:
+        server = smtplib.SMTP(self.host, self.port, timeout=30)
+        try:
+            if self.starttls:
+                server.starttls()
+            if self.user:
+                server.login(self.user, self.password)
+        except BaseException:
+            server.close()
+            raise
+        return _Session(server)
+
+    def _take(self) -> tuple[_Session, bool]:
+        """Return (session, reused): the most recently used live session, or a new one."""
+        with self._lock:
+            now = time.monotonic()
+            stale = [s for s in self._idle if now - s.last_used >= self.idle_timeout]
+            self._idle = [s for s in self._idle if now - s.last_used < self.idle_timeout]
+            session = self._idle.pop() if self._idle else None
+        for old in stale:
+            old.close()
+        if session is not None:
+            return session, True
+        return self._connect(), False
+
+    def _put(self, session: _Session) -> None:
+        session.last_used = time.monotonic()
+        if session.sent >= self.messages_per_session:
+            session.close()
+            return
+        with self._lock:
+            self._idle.append(session)
+
+    def send(self, msg) -> None:
+        """Send one message. Raises smtplib.SMTPException or OSError on failure."""
+        self._send(lambda server: server.send_message(msg))
+
+    def send_raw(self, from_addr: str, to: str, data: bytes) -> None:
+        """Send an already encoded message (CRLF line endings). Raises like send()."""
+        self._send(lambda server: server.sendmail(from_addr, [to], data))
+
+    def _send(self, transmit) -> None:
+        with self._slots:
+            for attempt in (1, 2):
+                session, reused = self._take()
+                try:
+                    transmit(session.server)
+                except smtplib.SMTPResponseException:
+                    # The server rejected this message; the connection is still fine.
+                    self._put(session)
+                    raise
+                except (smtplib.SMTPException, OSError):
+                    session.server.close()
+                    if reused and attempt == 1:
+                        continue  # went stale while idle: retry on a new connection
+                    raise
+                session.sent += 1
+                self._put(session)
+                return
+
+    def close(self) -> None:
+        """Close all idle sessions."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for session in idle:
+            session.close()
+
+
+_pool: SMTPPool | None = None
+_pool_lock = threading.Lock()
+
+
+def smtp_pool() -> SMTPPool:
+    """The process-wide SMTP pool, created from the SMTP_* settings on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SMTPPool(
+                SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASS, starttls=SMTP_STARTTLS,
+                max_sessions=SMTP_MAX_SESSIONS, idle_timeout=SMTP_IDLE_TIMEOUT,
+                messages_per_session=SMTP_MESSAGES_PER_SESSION,
+            )
+        return _pool
+
+
+def close_smtp_pool() -> None:
+    """Close pooled SMTP sessions (shutdown, or after changing SMTP_* settings)."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+
+
+def ascii_address(address: str) -> str:
+    """An address usable in SMTP envelopes and headers without SMTPUTF8.
+
+    An internationalized domain is converted to IDNA (punycode). A
+    non-ASCII local part can't be converted and raises ValueError.
+    """
+    if address.isascii():
+        return address
+    local, _, domain = address.rpartition("@")
+    if not local.isascii():
+        raise ValueError(f"Address {address!r} needs SMTPUTF8 (non-ASCII local part)")
+    try:
+        return f"{local}@{domain.encode('idna').decode('ascii')}"
+    except UnicodeError as e:
+        raise ValueError(f"Address {address!r} has an invalid domain: {e}") from None
+
+
+def deliver(to: str, subject: str, html: str, text: str = "") -> None:
+    """Send an email via the pooled SMTP connection, raising on failure."""
     if not SMTP_HOST:
-        print(f"[mail] SMTP not configured. Would send to {to}: {subject}")
-        return False
+        raise RuntimeError("SMTP not configured")
 
     msg = MIMEMultipart("alternative")
     msg["From"] = f"{FROM_NAME} <{FROM_EMAIL}>"
-    msg["To"] = to
+    msg["To"] = ascii_address(to)
     msg["Subject"] = subject
 
     if text:
         msg.attach(MIMEText(text, "plain"))
     msg.attach(MIMEText(html, "html"))
 
-    try:
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_USER, SMTP_PASS)
-            server.send_message(msg)
-        return True
-    except Exception as e:
-        print(f"[mail] Failed to send to {to}: {e}")
-        return False
+    smtp_pool().send(msg)
 
 
-def send_confirmation(email: str, confirm_token: str, lang: str = "en"):
-    """Send a double opt-in confirmation email."""
+def render_confirmation(confirm_token: str, lang: str = "en") -> tuple[str, str, str]:
+    """Build the (subject, html, text) of a double opt-in confirmation email."""
     confirm_url = f"{BASE_URL}/subscribe/confirm/{confirm_token}"
 
     if lang == "nl":
@@ -101,7 +252,7 @@ def send_confirmation(email: str, confirm_token: str, lang: str = "en"):
         """
         text = f"Confirm your subscription to the Siskin Labs mailing list: {confirm_url}"
 
-    return _send(email, subject, html, text)
+    return subject, html, text
 
 
 def _wrap_newsletter(body_html: str, unsubscribe_url: str, lang: str = "en") -> str:
@@ -121,9 +272,80 @@ def _wrap_newsletter(body_html: str, unsubscribe_url: str, lang: str = "en") ->
     """
 
 
+class NewsletterMessage:
+    """A newsletter rendered and MIME-encoded once, for one language.
+
+    Each part (plain text if given, then HTML) is quoted-printable encoded
+    around the unsubscribe link, so render() only has to encode the
+    recipient's URL and join byte strings: no template formatting or MIME
+    tree per recipient. QP soft line breaks (=CRLF) around the link keep
+    the decoded parts identical to the _wrap_newsletter* output.
+    """
+
+    _SLOT = "\x00unsubscribe\x00"
+
+    def __init__(self, subject: str, body_html: str, lang: str = "en", body_text: str = ""):
+        parts = [("html", _wrap_newsletter(body_html, self._SLOT, lang))]
+        if body_text:
+            parts.insert(0, ("plain", _wrap_newsletter_text(body_text, self._SLOT, lang)))
+        boundary = "=_" + secrets.token_hex(12)
+        self._head = (
+            f"From: {formataddr((FROM_NAME, FROM_EMAIL), 'utf-8')}\r\n"
+            f"Subject: {Header(subject, 'utf-8').encode()}\r\n"
+            "MIME-Version: 1.0\r\n"
+            f'Content-Type: multipart/alternative; boundary="{boundary}"\r\n'
+        ).encode("ascii")
+        # The body as byte segments; render() puts the unsubscribe URL between each pair.
+        self._segments: list[bytes] = []
+        segment = b""
+        for subtype, content in parts:
+            segment += (
+                f"\r\n--{boundary}\r\n"
+                f'Content-Type: text/{subtype}; charset="utf-8"\r\n'
+                "Content-Transfer-Encoding: quoted-printable\r\n"
+                "\r\n"
+            ).encode("ascii")
+            first, *rest = content.split(self._SLOT)
+            segment += _qp(first)
+            for piece in rest:
+                self._segments.append(segment)
+                segment = _qp(piece)
+        self._segments.append(segment + f"\r\n--{boundary}--\r\n".encode("ascii"))
+
+    def render(self, to: str, unsubscribe_token: str) -> bytes:
+        """The encoded message for one recipient. See ascii_address() for non-ASCII addresses."""
+        url = _qp(f"{BASE_URL}/unsubscribe/{unsubscribe_token}")
+        return b"".join((b"To: ", ascii_address(to).encode("ascii"), b"\r\n", self._head,
+                         (b"=\r\n" + url + b"=\r\n").join(self._segments)))
+
+
+def _qp(text: str) -> bytes:
+    return quoprimime.body_encode(text.encode("utf-8").decode("latin-1"), eol="\r\n").encode("ascii")
+
+
+def _wrap_newsletter_text(body_text: str, unsubscribe_url: str, lang: str = "en") -> str:
+    """Plain-text counterpart of _wrap_newsletter."""
+    unsub_text = "Afmelden" if lang == "nl" else "Unsubscribe"
+    return f"Siskin Labs\n\n{body_text}\n\n--\nSiskin Labs · Amsterdam\n{unsub_text}: {unsubscribe_url}\n"
+
+
+def deliver_newsletter(to: str, message: NewsletterMessage, unsubscribe_token: str) -> None:
+    """Send a compiled newsletter to a single subscriber, raising on failure."""
+    if not SMTP_HOST:
+        raise RuntimeError("SMTP not configured")
+    to = ascii_address(to)
+    smtp_pool().send_raw(FROM_EMAIL, to, message.render(to, unsubscribe_token))
+
+
 def send_newsletter(email: str, subject: str, body_html: str,
-                    unsubscribe_token: str, lang: str = "en") -> bool:
+                    unsubscribe_token: str, lang: str = "en", body_text: str = "") -> bool:
     """Send a newsletter email to a single subscriber."""
-    unsubscribe_url = f"{BASE_URL}/unsubscribe/{unsubscribe_token}"
-    html = _wrap_newsletter(body_html, unsubscribe_url, lang)
-    return _send(email, subject, html)
+    if not SMTP_HOST:
+        print(f"[mail] SMTP not configured. Would send to {email}: {subject}")
+        return False
+    try:
+        deliver_newsletter(email, NewsletterMessage(subject, body_html, lang, body_text), unsubscribe_token)
+        return True
+    except Exception as e:
+        print(f"[mail] Failed to send to {email}: {e}")
+        return False
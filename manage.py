@@ -0,0 +1,122 @@
+"""Command-line maintenance for the Siskin Labs database.
+
+Usage: python manage.py <command> [options]
+       python manage.py --help
+"""
+
+import argparse
+import contextlib
+import csv
+import sys
+
+import database
+
+
+def cmd_reconcile_counters(args):
+    """Rebuild subscriber/waitlist counters from the base tables."""
+    drift = database.reconcile_counters()
+    for table, rows in drift.items():
+        print(f"{table}: {rows} counter row{'s' if rows != 1 else ''} corrected")
+    print(f"Confirmed subscribers: {database.count_subscribers()}")
+    print(f"Waitlist: {database.count_waitlist()}")
+
+
+def cmd_import_subscribers(args):
+    """Bulk-import subscribers from a CSV file (same columns as the export)."""
+    def progress(result):
+        print(f"  {result.read} read, {result.inserted} inserted, "
+              f"{result.duplicates} duplicates, {result.invalid} invalid", file=sys.stderr)
+
+    with open(args.file, newline="", encoding="utf-8") as f:
+        result = database.import_subscribers(
+            csv.DictReader(f), confirmed=args.confirmed, chunk_size=args.chunk_size, progress=progress,
+        )
+    print(f"Imported {result.inserted} of {result.read} rows "
+          f"({result.duplicates} duplicates, {result.invalid} invalid), "
+          f"queued {result.confirmations_queued} confirmation emails")
+
+
+def cmd_export(args):
+    """Stream a table to CSV (stdout by default)."""
+    with (open(args.output, "w", newline="", encoding="utf-8") if args.output
+          else contextlib.nullcontext(sys.stdout)) as out:
+        writer = csv.writer(out)
+        writer.writerow(database.EXPORT_COLUMNS[args.table])
+        writer.writerows(database.iter_export_rows(args.table))
+
+
+def cmd_maintenance(args):
+    """Expire stale unconfirmed sign-ups, vacuum free pages and checkpoint the WAL."""
+    if args.enable_incremental_vacuum:
+        print("Converting to auto_vacuum=INCREMENTAL (full VACUUM)...")
+        database.enable_incremental_vacuum()
+    report = database.run_maintenance(args.max_age_days, args.batch_size)
+    print(f"Expired {report.expired} unconfirmed subscriber{'s' if report.expired != 1 else ''} "
+          f"older than {args.max_age_days} days")
+    print(f"Pruned {report.outbox_pruned} sent/failed outbox message{'s' if report.outbox_pruned != 1 else ''} "
+          f"older than {database.OUTBOX_RETENTION_DAYS} days")
+    if report.incremental_vacuum:
+        print(f"Reclaimed {report.pages_freed} pages ({report.bytes_freed / 1024:.0f} KiB)")
+    else:
+        print("Incremental vacuum is off for this database; rerun with --enable-incremental-vacuum")
+    print(f"Checkpointed {report.wal_frames_checkpointed} WAL frames"
+          + (" (readers busy, WAL not truncated)" if report.checkpoint_busy else ""))
+
+
+def cmd_outbox_worker(args):
+    """Deliver queued mail from the outbox until interrupted."""
+    import outbox
+
+    if args.once:
+        claimed = outbox.run_once()
+        print(f"Processed {claimed} message{'s' if claimed != 1 else ''}")
+    else:
+        worker = outbox.start_worker()
+        print(f"Outbox worker running (polling every {worker.poll_seconds:g}s), Ctrl-C to stop")
+        try:
+            while worker.is_alive():
+                worker.join(1)
+        except KeyboardInterrupt:
+            outbox.stop_worker()
+    stats = database.outbox_stats()
+    print("Outbox: " + ", ".join(f"{n} {status}" for status, n in sorted(stats.items())) if stats else "Outbox: empty")
+    print(f"Confirmations suppressed by the resend cooldown: {database.count_suppressed_confirmations()}")
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Siskin Labs database maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("reconcile-counters", help=cmd_reconcile_counters.__doc__)
+    p.set_defaults(func=cmd_reconcile_counters)
+
+    p = commands.add_parser("import-subscribers", help=cmd_import_subscribers.__doc__)
+    p.add_argument("file", help="CSV with at least an 'email' column")
+    p.add_argument("--confirmed", action="store_true",
+                   help="import rows without a confirmed column as confirmed (lists that opted in elsewhere)")
+    p.add_argument("--chunk-size", type=int, default=1000)
+    p.set_defaults(func=cmd_import_subscribers)
+
+    p = commands.add_parser("export", help=cmd_export.__doc__)
+    p.add_argument("table", choices=sorted(database.EXPORT_COLUMNS))
+    p.add_argument("-o", "--output", help="write to a file instead of stdout")
+    p.set_defaults(func=cmd_export)
+
+    p = commands.add_parser("maintenance", help=cmd_maintenance.__doc__)
+    p.add_argument("--max-age-days", type=int, default=database.UNCONFIRMED_MAX_AGE_DAYS)
+    p.add_argument("--batch-size", type=int, default=500)
+    p.add_argument("--enable-incremental-vacuum", action="store_true",
+                   help="convert an older database first (rewrites the file)")
+    p.set_defaults(func=cmd_maintenance)
+
+    p = commands.add_parser("outbox-worker", help=cmd_outbox_worker.__doc__)
+    p.add_argument("--once", action="store_true", help="process one batch of due messages and exit")
+    p.set_defaults(func=cmd_outbox_worker)
+
+    args = parser.parse_args(argv)
+    database.init_db()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Durable outbox for request-triggered mail.
+
+Handlers store a message in the outbox table (in SQLite, so it survives a
+restart or crash) and return; a worker thread claims due messages and
+delivers them through the SMTP pool. Failures are retried with
+exponential backoff until OUTBOX_MAX_ATTEMPTS, after which the message is
+marked failed and left for inspection. Sent and failed messages are
+deleted after WEBSITE_OUTBOX_RETENTION_DAYS by database.run_maintenance.
+
+The worker runs inside the web process by default. Set
+WEBSITE_OUTBOX_WORKER=0 to run it separately (python manage.py outbox-worker).
+"""
+
+import os
+import threading
+from datetime import datetime, timedelta
+
+import database
+import mail
+
+OUTBOX_WORKER = os.environ.get("WEBSITE_OUTBOX_WORKER", "1").lower() not in ("0", "false", "no")
+OUTBOX_BATCH_SIZE = int(os.environ.get("WEBSITE_OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_POLL_SECONDS = float(os.environ.get("WEBSITE_OUTBOX_POLL_SECONDS", "5"))
+OUTBOX_LEASE_SECONDS = float(os.environ.get("WEBSITE_OUTBOX_LEASE_SECONDS", "300"))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("WEBSITE_OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_SECONDS = 30
+OUTBOX_BACKOFF_MAX_SECONDS = 3600
+
+
+def _send_confirmation(recipient: str, payload: dict) -> None:
+    mail.deliver(recipient, *mail.render_confirmation(payload["confirm_token"], payload.get("lang", "en")))
+
+
+# Message kind -> function(recipient, payload) that delivers it, raising on failure.
+SENDERS = {
+    "confirmation": _send_confirmation,
+}
+
+
+def retry_delay(attempts: int) -> float:
+    """Seconds to wait before the next try, after `attempts` failed ones."""
+    return min(OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1), OUTBOX_BACKOFF_MAX_SECONDS)
+
+
+def run_once(limit: int = OUTBOX_BATCH_SIZE) -> int:
+    """Claim and deliver one batch of due messages. Returns how many were claimed.
+
+    Each message is marked sent as soon as it is delivered, so a crash
+    mid-batch doesn't send the delivered ones again. Without SMTP_HOST
+    (local development) a message is only logged, then marked sent rather
+    than retried.
+    """
+    messages = database.claim_outbox(limit, OUTBOX_LEASE_SECONDS)
+    for message in messages:
+        if not mail.SMTP_HOST:
+            print(f"[mail] SMTP not configured. Would send {message.kind} to {message.recipient}")
+            database.mark_outbox_sent(message.id)
+            continue
+        try:
+            SENDERS[message.kind](message.recipient, message.payload)
+        except Exception as e:
+            if message.attempts >= OUTBOX_MAX_ATTEMPTS:
+                print(f"[mail] Giving up on {message.kind} to {message.recipient} "
+                      f"after {message.attempts} attempts: {e}")
+                database.mark_outbox_failed(message.id, str(e), None)
+            else:
+                retry_at = datetime.utcnow() + timedelta(seconds=retry_delay(message.attempts))
+                print(f"[mail] Failed {message.kind} to {message.recipient} "
+                      f"(attempt {message.attempts}), retrying at {retry_at:%H:%M:%S}: {e}")
+                database.mark_outbox_failed(message.id, str(e), retry_at)
+        else:
+            database.mark_outbox_sent(message.id)
+    return len(messages)
+
+
+class OutboxWorker(threading.Thread):
+    """Background thread that drains the outbox.
+
+    Sleeps for OUTBOX_POLL_SECONDS between polls (so retries come due),
+    and is woken immediately when new mail is queued in this process.
+    """
+
+    def __init__(self, poll_seconds: float = OUTBOX_POLL_SECONDS):
+        super().__init__(name="outbox", daemon=True)
+        self.poll_seconds = poll_seconds
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def run(self):
+        while not self._stopping.is_set():
+            self._wake.clear()
+            try:
+                claimed = run_once()
+            except Exception as e:
+                print(f"[mail] Outbox worker error: {e}")
+                claimed = 0
+            if claimed < OUTBOX_BATCH_SIZE:
+                self._wake.wait(self.poll_seconds)
+
+    def stop(self, timeout: float = 10) -> None:
+        """Stop after the current batch. Undelivered mail stays in the outbox."""
+        self._stopping.set()
+        self._wake.set()
+        self.join(timeout)
+
+
+_worker: OutboxWorker | None = None
+_worker_lock = threading.Lock()
+
+
+def start_worker() -> OutboxWorker:
+    """Start the process-wide outbox worker, if it isn't running yet."""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = OutboxWorker()
+            _worker.start()
+        return _worker
+
+
+def stop_worker(timeout: float = 10) -> None:
+    """Stop the outbox worker, if it was started."""
+    global _worker
+    with _worker_lock:
+        worker, _worker = _worker, None
+    if worker is not None:
+        worker.stop(timeout)
+
+
+def wake_worker() -> None:
+    """Have the worker poll now, after mail was queued in this process."""
+    with _worker_lock:
+        if _worker is not None:
+            _worker.wake()